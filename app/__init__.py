@@ -0,0 +1,9 @@
+import os
+
+# Settings for local development can go in a .env file at the project root (deploys set them in the environment)
+# Loaded here, before any module reads its settings, and only if the file exists, so deploys don't import python-dotenv at all
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+
+if os.path.exists(ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE)
@@ -0,0 +1,128 @@
+from fastapi import HTTPException, Query
+from sqlalchemy import select, update, delete, case, tuple_
+
+from .database import dialect_insert
+from .mutations import update_values
+from .schemas import BatchItemResult, BulkItemResult
+
+# Bulk creation for the catalog routers
+# The whole batch is one multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING, instead of four round trips per item.
+# The natural keys are unique constraints, so rows that already exist are skipped by the database,
+# and any item whose key isn't returned is reported as a conflict -- as is an item repeating an earlier one in the batch.
+
+BULK_MAX_ITEMS = 500
+
+ids_query = Query(description=f"Comma-separated ids, e.g. 1,2,3 (at most {BULK_MAX_ITEMS})")
+
+async def bulk_create(db, model, items: list, key_columns: list[str]) -> list[BulkItemResult]:
+    rows = [item.model_dump() for item in items]
+    keys = [tuple(row[column] for column in key_columns) for row in rows]
+    columns = [getattr(model, column) for column in key_columns]
+
+    # First occurrence of each key in the batch
+    first_seen = {}
+    for index, key in enumerate(keys):
+        first_seen.setdefault(key, index)
+
+    statement = dialect_insert(db, model).values([rows[index] for index in first_seen.values()])
+    statement = statement.on_conflict_do_nothing(index_elements=columns).returning(model.id, *columns)
+    created = {tuple(key): id for id, *key in (await db.execute(statement)).all()}
+
+    results = []
+    for index, key in enumerate(keys):
+        if first_seen[key] == index and key in created:
+            results.append(BulkItemResult(index=index, status="created", id=created[key]))
+        else:
+            results.append(BulkItemResult(index=index, status="conflict", detail=f"{', '.join(key)} already exists."))
+
+    return results
+
+# Batch updates and deletes by key (id, or name for the profile)
+# The whole batch is a fixed number of set-based statements, whatever its size:
+#   PATCH:  SELECT the rows (locked), SELECT rows holding the new unique keys, one UPDATE ... SET column = CASE id ...
+#   DELETE: one DELETE ... WHERE id IN (...) RETURNING
+# Each key gets its own result. Updates that would break a unique constraint are reported as conflicts and skipped,
+# checked against every row's current key -- so two rows can't swap keys in one batch.
+
+def parse_keys(keys: str, convert=int) -> list:
+    try:
+        parsed = [convert(key.strip()) for key in keys.split(",") if key.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Expected a comma-separated list of ids.")
+
+    if not parsed:
+        raise HTTPException(status_code=400, detail="No ids given.")
+    if len(parsed) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} ids per request.")
+
+    # Repeated keys are only reported once
+    return list(dict.fromkeys(parsed))
+
+# Returns the results, and the deleted rows
+async def batch_delete(db, model, keys: list, key_column: str = "id") -> tuple[list[BatchItemResult], list]:
+    column = getattr(model, key_column)
+    deleted = (await db.execute(delete(model).filter(column.in_(keys)).returning(*model.__table__.columns))).all()
+    found = {row._mapping[key_column] for row in deleted}
+
+    results = [
+        BatchItemResult(id=key, status="deleted") if key in found else BatchItemResult(id=key, status="not_found", detail=f"{key} not found.")
+        for key in keys
+    ]
+    return results, deleted
+
+# items are update schemas that include the key column, and only the fields they set are changed (like PUT)
+# prepare(current row, values) can add derived columns to an item's values (e.g. the visit content hash)
+# Returns the results, and (row before, row after) for each updated row
+async def batch_update(db, model, items: list, key_column: str, unique_columns: list[str], prepare=None) -> tuple[list[BatchItemResult], list[tuple]]:
+    key = getattr(model, key_column)
+    table_columns = model.__table__.columns
+    changes = [update_values(item) for item in items]
+    keys = [values.pop(key_column) for values in changes]
+
+    current = {row._mapping[key_column]: row for row in (await db.execute(select(*table_columns).filter(key.in_(keys)).with_for_update())).all()}
+
+    # Derived columns first, since they can be part of the unique key
+    if prepare:
+        changes = [prepare(current[item_key], values) if values and item_key in current else values for item_key, values in zip(keys, changes)]
+
+    def unique_key(item_key, values) -> tuple:
+        return tuple(values.get(column, current[item_key]._mapping[column]) for column in unique_columns)
+
+    # Unique keys in use: every batch row's current key, plus other rows holding any of the new ones
+    taken = {unique_key(item_key, {}): item_key for item_key in current}
+    new_keys = {unique_key(item_key, values) for item_key, values in zip(keys, changes) if item_key in current} - taken.keys()
+    if new_keys:
+        holders = select(key, *[getattr(model, column) for column in unique_columns]).filter(tuple_(*[getattr(model, column) for column in unique_columns]).in_(new_keys))
+        taken.update({tuple(unique): holder for holder, *unique in (await db.execute(holders)).all()})
+
+    results = []
+    accepted = {} # key -> values to write
+    for index, (item_key, values) in enumerate(zip(keys, changes)):
+        if item_key not in current:
+            results.append(BatchItemResult(id=item_key, status="not_found", detail=f"{item_key} not found."))
+            continue
+        if item_key in accepted:
+            results.append(BatchItemResult(id=item_key, status="conflict", detail=f"{item_key} repeats an earlier item."))
+            continue
+
+        new_key = unique_key(item_key, values)
+        if new_key != unique_key(item_key, {}) and taken.get(new_key, item_key) != item_key:
+            results.append(BatchItemResult(id=item_key, status="conflict", detail=f"Same {', '.join(unique_columns)} as {taken[new_key]}."))
+            continue
+
+        taken[new_key] = item_key
+        accepted[item_key] = values
+        results.append(BatchItemResult(id=item_key, status="updated"))
+
+    # One UPDATE for the whole batch, each column set to its new value per key (or left as it is)
+    updated = []
+    accepted = {item_key: values for item_key, values in accepted.items() if values}
+    if accepted:
+        columns = dict.fromkeys(column for values in accepted.values() for column in values)
+        statement = update(model).filter(key.in_(accepted)).values({
+            column: case({item_key: values[column] for item_key, values in accepted.items() if column in values}, value=key, else_=getattr(model, column))
+            for column in columns
+        }).returning(*table_columns).execution_options(synchronize_session=False)
+        updated = [(current[row._mapping[key_column]], row) for row in (await db.execute(statement)).all()]
+
+    return results, updated
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+import os
+import time
+
+from .snapshot import SNAPSHOT_MODE
+
+# In-process read-through cache for the catalog endpoints (profile, skills, education, experience)
+# That data changes maybe once a month, so repeated reads are served without touching the database.
+# Entries expire after CACHE_TTL seconds, the least recently used entry is evicted past CACHE_MAXSIZE entries,
+# and the POST/PUT/DELETE handlers invalidate their endpoint's entries as soon as they commit.
+# Each worker process has its own cache, so other workers only see a change once their entries expire.
+# In SNAPSHOT_MODE the data is already in memory, and reloaded when another worker rewrites the file, so nothing is cached.
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", 300))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", 256))
+
+class ResponseCache:
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict() # key -> (expires at, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Normalize query parameters, so equivalent requests share an entry
+    # Unset and empty parameters are ignored by the handlers, so they are left out of the key
+    def key(self, endpoint: str, **params) -> tuple:
+        normalized = []
+        for name, value in sorted(params.items()):
+            if isinstance(value, str):
+                value = value.strip()
+            if value is None or value == "":
+                continue
+            normalized.append((name, value))
+
+        return (endpoint, tuple(normalized))
+
+    def get(self, key: tuple):
+        entry = self.entries.get(key)
+
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    # None means "not cached" to get(), so it isn't stored
+    def set(self, key: tuple, value):
+        if self.ttl <= 0 or value is None:
+            return
+
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # Drop every entry for an endpoint (after a write to its table)
+    def invalidate(self, endpoint: str):
+        for key in [key for key in self.entries if key[0] == endpoint]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+            "max_size": self.maxsize,
+            "ttl_seconds": self.ttl
+        }
+
+catalog_cache = ResponseCache(0 if SNAPSHOT_MODE else CACHE_TTL, CACHE_MAXSIZE)
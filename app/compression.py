@@ -0,0 +1,159 @@
+from collections import OrderedDict
+import gzip
+import hashlib
+import os
+
+# brotli is optional -- without it, responses are only gzipped
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression, negotiated from Accept-Encoding (br is preferred over gzip when both are accepted)
+# Only complete JSON and text bodies of at least COMPRESSION_MIN_SIZE bytes are compressed.
+# Streamed responses (e.g. /visits/export) and responses that already have a Content-Encoding pass through unchanged.
+# Compressed bodies are kept in an LRU cache keyed by a hash of the uncompressed body, so repeat requests for
+# unchanged data (most GETs) skip compressing again. COMPRESSION_CACHE_BYTES limits its total size (0 turns it off).
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024)) # bytes
+COMPRESSION_CACHE_BYTES = int(os.getenv("COMPRESSION_CACHE_BYTES", 8 * 1024 * 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/")
+
+def available_encodings() -> list[str]:
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+# The encoding to use for a request, or None for identity
+def negotiate(accept_encoding: str, encodings: list[str]) -> str | None:
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.strip().partition(";")
+        quality = 1.0
+        parameter = parameters.strip()
+        if parameter.startswith("q="):
+            try:
+                quality = float(parameter[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class CompressionCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # (body hash, encoding) -> compressed body
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if not self.max_bytes:
+            return compress(body, encoding)
+
+        key = (hashlib.sha1(body, usedforsecurity=False).digest(), encoding)
+        compressed = self.entries.get(key)
+        if compressed is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return compressed
+
+        self.misses += 1
+        compressed = compress(body, encoding)
+        if len(compressed) <= self.max_bytes:
+            self.entries[key] = compressed
+            self.size += len(compressed)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+        return compressed
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+compression_cache = CompressionCache(COMPRESSION_CACHE_BYTES)
+
+# Pure ASGI middleware, so streaming responses pass straight through
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, cache: CompressionCache = compression_cache):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"accept-encoding"), "")
+        encoding = negotiate(accept_encoding, self.encodings)
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+
+            # Hold the start message until the first body message shows whether the response is complete
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            start_message, start = start, None
+            body = message.get("body", b"")
+            headers = list(start_message.get("headers", []))
+
+            if message.get("more_body", False) or not self.compressible(headers, body):
+                await send(start_message)
+                await send(message)
+                return
+
+            # Responses that could be compressed vary by Accept-Encoding, whether or not this one is
+            headers = [(name, value) for name, value in headers if name != b"vary"] + [(b"vary", vary(headers))]
+
+            if encoding:
+                body = self.cache.compress(body, encoding)
+                headers = [(name, value) for name, value in headers if name != b"content-length"] + [
+                    (b"content-encoding", encoding.encode()),
+                    (b"content-length", str(len(body)).encode())
+                ]
+
+            await send({**start_message, "headers": headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def compressible(self, headers: list, body: bytes) -> bool:
+        if len(body) < self.minimum_size:
+            return False
+        content_type = b""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+# The Vary header with Accept-Encoding added to any existing value
+def vary(headers: list) -> bytes:
+    values = [value.strip() for name, header in headers if name == b"vary" for value in header.split(b",") if value.strip()]
+    if b"accept-encoding" not in [value.lower() for value in values]:
+        values.append(b"Accept-Encoding")
+    return b", ".join(values)
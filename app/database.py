@@ -1,23 +1,206 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from .pool_metrics import MeteredQueuePool, instrument
+from .query_log import instrument_queries
+from .ratelimit import client_address
+from fastapi import Request, Response
+from functools import cache
+import logging
+import math
 import os
-
-load_dotenv()
+import time
 
 DATABASE_URL = os.getenv("NEON_DB_URL")
 
-# TODO: Remove echo before deploy
-engine = create_engine(DATABASE_URL, echo=True)
+# Optional read replica -- GET requests read from it, unless the client wrote very recently (see get_read_db)
+REPLICA_URL = os.getenv("NEON_REPLICA_URL")
+
+# Async driver for each database (postgresql://... becomes postgresql+psycopg://...)
+ASYNC_DRIVERS = {
+    "postgresql": "psycopg",
+    "sqlite": "aiosqlite"
+}
+
+def async_url(url: str):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+# Engine settings
+# DB_ECHO logs every statement (synchronously, so only turn it on for debugging -- app/query_log.py logs slow ones)
+# Neon limits connections and closes idle ones, so the pool is kept small, recycled, and checked before use
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30)) # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 300)) # Seconds before a connection is replaced (-1 to keep forever)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0)) # PostgreSQL only, 0 for no limit
+
+def engine_options(url) -> dict:
+    options = {
+        "echo": DB_ECHO,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+
+    if DB_STATEMENT_TIMEOUT_MS and make_url(url).get_backend_name() == "postgresql":
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+    return options
+
+# Engines are created on first use rather than at import, so a cold start doesn't pay for connecting
+# (or importing the database driver) before the app can answer its first request
+
+# Sync engine -- used for create_db() and the scripts in app/migrations
+@cache
+def get_engine():
+    return create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+
+@cache
+def get_sessionmaker():
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+# Async engine -- used by the API, so requests waiting on the database don't tie up the threadpool
+# Its pool reports live statistics at /admin/pool, and its statements are timed per request (see app/query_log.py)
+@cache
+def get_async_engine():
+    async_engine = create_async_engine(async_url(DATABASE_URL), poolclass=MeteredQueuePool, **engine_options(DATABASE_URL))
+    instrument(async_engine.sync_engine)
+    instrument_queries(async_engine.sync_engine)
+    return async_engine
+
+# Don't expire on commit, so returned objects can still be read without another round trip
+@cache
+def get_async_sessionmaker():
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+# New AsyncSession -- named like the sessionmaker it replaces, so callers don't change
+def AsyncSessionLocal():
+    return get_async_sessionmaker()()
+
+# Read replica engine (same settings as the primary), if NEON_REPLICA_URL is set
+# Its statements are timed per request too, but /admin/pool only reports the primary's pool
+@cache
+def get_replica_engine():
+    replica_engine = create_async_engine(async_url(REPLICA_URL), **engine_options(REPLICA_URL))
+    instrument_queries(replica_engine.sync_engine)
+    return replica_engine
+
+@cache
+def get_replica_sessionmaker():
+    return async_sessionmaker(get_replica_engine(), autoflush=False, expire_on_commit=False)
+
+# New AsyncSession for reads -- on the replica if there is one, unless the primary is asked for
+def ReadSessionLocal(primary: bool = False):
+    if primary or not REPLICA_URL:
+        return AsyncSessionLocal()
+    return get_replica_sessionmaker()()
+
+# The old module attributes still work for scripts (from app.database import engine), creating the engine when imported
+LAZY_ATTRIBUTES = {
+    "engine": get_engine,
+    "SessionLocal": get_sessionmaker,
+    "async_engine": get_async_engine
+}
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def __getattr__(name: str):
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# INSERT statement for the database in use, with its ON CONFLICT clauses available
+def dialect_insert(db, table):
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    if db.bind.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+# Read-your-writes
+# A replica can lag slightly behind the primary, so after a client writes, its reads go to the primary
+# for READ_YOUR_WRITES_SECONDS. Clients are recognized by address (this worker), and by a cookie (any worker).
+# Writes to the cached catalog tables send every client's reads of that table to the primary for the window,
+# so a lagging replica can't refill the cache with the old rows.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+READ_PRIMARY_COOKIE = "read_primary_until"
+CATALOG_TABLES = {"profile", "skills", "education", "experience"}
+
+class RecentWrites:
+    # Past this many keys, expired ones are dropped
+    MAX_KEYS = 10000
+
+    def __init__(self, window: float):
+        self.window = window
+        self.until = {} # key -> monotonic time its window ends
+
+    def mark(self, key: str):
+        now = time.monotonic()
+        self.until[key] = now + self.window
+        if len(self.until) > self.MAX_KEYS:
+            for expired in [key for key, until in self.until.items() if until <= now]:
+                del self.until[expired]
+
+    def recent(self, key: str) -> bool:
+        return self.until.get(key, 0) > time.monotonic()
+
+recent_writes = RecentWrites(READ_YOUR_WRITES_SECONDS)
+
+# First path segment (/skills/3 -> skills)
+def _resource(request: Request) -> str:
+    return request.url.path.strip("/").split("/")[0]
+
+def read_from_primary(request: Request, tables=()) -> bool:
     try:
+        cookie = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        cookie = 0
+    return (
+        cookie > time.time()
+        or recent_writes.recent(f"client:{client_address(request)}")
+        or any(recent_writes.recent(f"table:{table}") for table in tables)
+    )
+
+# Session for GET handlers
+async def get_read_db(request: Request):
+    async with ReadSessionLocal(primary=read_from_primary(request, {_resource(request)} & CATALOG_TABLES)) as db:
+        yield db
+
+# Start the client's read-your-writes window (and the table's, for catalog tables)
+def mark_write(request: Request, response: Response):
+    recent_writes.mark(f"client:{client_address(request)}")
+    if _resource(request) in CATALOG_TABLES:
+        recent_writes.mark(f"table:{_resource(request)}")
+    response.set_cookie(READ_PRIMARY_COOKIE, str(time.time() + READ_YOUR_WRITES_SECONDS), max_age=math.ceil(READ_YOUR_WRITES_SECONDS), httponly=True)
+
+# Session for POST/PUT/DELETE handlers, always on the primary
+# The windows only start once the handler commits, so rejected writes (401, 404, 409) don't send reads to the primary.
+# Handlers commit before returning, so the cookie is still added to their response.
+async def get_write_db(request: Request, response: Response):
+    async with AsyncSessionLocal() as db:
+        if REPLICA_URL:
+            event.listen(db.sync_session, "after_commit", lambda session: mark_write(request, response))
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+# Open one pooled connection in the background at startup (DB_PREWARM=false to skip),
+# so the first request doesn't also pay for the connection handshake
+DB_PREWARM = os.getenv("DB_PREWARM", "true").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+async def prewarm():
+    try:
+        engines = [get_async_engine(), get_replica_engine()] if REPLICA_URL else [get_async_engine()]
+        for async_engine in engines:
+            async with async_engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+    except Exception:
+        logger.exception("Failed to pre-warm a database connection")
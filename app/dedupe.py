@@ -0,0 +1,7 @@
+import hashlib
+
+# Content hash used to reject duplicate visits through a unique index
+# Fields are whitespace-collapsed and case-folded first, so "Hi  there" and "hi there" count as the same message
+def visit_content_hash(name: str, relation: str, message: str) -> str:
+    fields = [" ".join(value.split()).casefold() for value in (name, relation, message)]
+    return hashlib.sha256("\x1f".join(fields).encode()).hexdigest()
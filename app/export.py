@@ -0,0 +1,63 @@
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+import csv
+import io
+import orjson
+
+from .database import ReadSessionLocal
+
+# Streaming bulk exports
+# Rows are read through a server-side cursor (yield_per) and written out one batch at a time,
+# so memory use depends on EXPORT_BATCH_SIZE rather than on the size of the table.
+# The query runs in its own session (on the read replica, if there is one) inside the generator, since the response is still streaming
+# after the endpoint (and its request-scoped session) has returned.
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+def _encode_ndjson(rows: list[dict], columns: list[str], header: bool) -> bytes:
+    return b"".join(orjson.dumps(dict(row)) + b"\n" for row in rows)
+
+def _encode_csv(rows: list[dict], columns: list[str], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([[_csv_value(row[column]) for column in columns] for row in rows])
+    return buffer.getvalue().encode()
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+ENCODERS = {
+    "ndjson": _encode_ndjson,
+    "csv": _encode_csv
+}
+
+# Stream the rows of a column select as an attachment
+def stream_export(statement, format: str, filename: str) -> StreamingResponse:
+    columns = [column.key for column in statement.selected_columns]
+    encode = ENCODERS[format]
+
+    async def generate():
+        async with ReadSessionLocal() as db:
+            result = await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+            # CSV gets a header row even when there are no rows
+            header = True
+            async for batch in result.mappings().partitions():
+                yield encode(batch, columns, header)
+                header = False
+            if header and format == "csv":
+                yield encode([], columns, header)
+
+    return StreamingResponse(
+        generate(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'})
@@ -1,10 +1,33 @@
 from fastapi import FastAPI
-from .database import Base, engine
+from contextlib import asynccontextmanager, suppress
+from .database import Base, DB_PREWARM, get_engine, prewarm
+from .visit_buffer import visit_buffer
+import asyncio
 
-from .routers import profile, skills, education, experience, visits
+from .compression import CompressionMiddleware
+from .metrics import MetricsMiddleware
+from .query_log import QueryTimingMiddleware
+
+from .routers import profile, skills, education, experience, visits, portfolio, admin, metrics
 
 def create_db():
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(get_engine())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect to the database in the background, so startup isn't held up waiting for it
+    warming = asyncio.create_task(prewarm()) if DB_PREWARM else None
+
+    # Start the write-behind visit queue, and write whatever is left in it on shutdown
+    if visit_buffer:
+        await visit_buffer.start()
+    yield
+    if visit_buffer:
+        await visit_buffer.stop()
+    if warming and not warming.done():
+        warming.cancel()
+        with suppress(asyncio.CancelledError):
+            await warming
 
 tags_metadata = [
     {
@@ -30,6 +53,14 @@ tags_metadata = [
     {
         "name": "Visits",
         "description": "**POST** a visit to my API! \nLeave your full name, relation (friend, family, recruiter, etc) and a message."
+    },
+    {
+        "name": "Portfolio",
+        "description": "My profile, skills, education and experience in a single request"
+    },
+    {
+        "name": "Admin",
+        "description": "Operational statistics (requires an API key)"
     }
 ]
 
@@ -41,15 +72,29 @@ app = FastAPI(
         "name": "Jacob Armstrong",
         "url": "https://jacobarmstrong.dev"
     },
-    openapi_tags=tags_metadata
+    openapi_tags=tags_metadata,
+    lifespan=lifespan
 )
 
+# Compress large JSON responses (gzip/brotli), reusing cached compressed bodies
+# Added first, so it runs inside the metrics middleware, which then records the compressed size
+app.add_middleware(CompressionMiddleware)
+
+# Record per-route latency, size and status metrics (served at /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Count each request's database statements and time (Server-Timing header), and log slow statements
+app.add_middleware(QueryTimingMiddleware)
+
 # Include routers
 app.include_router(profile.router)
 app.include_router(skills.router)
 app.include_router(education.router)
 app.include_router(experience.router)
 app.include_router(visits.router)
+app.include_router(portfolio.router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 async def root():
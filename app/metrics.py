@@ -0,0 +1,131 @@
+from collections import defaultdict
+import bisect
+import time
+
+# Per-route request metrics, exposed in Prometheus text format at /metrics
+# The middleware records latency and response size histograms for each route and method,
+# and counts requests by status. Routes are labelled by their path template (/visits/{id}),
+# and requests that don't match any route share one label, so the number of series stays small.
+# Every update happens on the event loop thread, so no locks are needed.
+# Each worker process keeps its own numbers -- Prometheus adds them up across workers (scrape each one).
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0] # seconds
+SIZE_BUCKETS = [100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000] # bytes
+
+UNMATCHED_ROUTE = "unmatched"
+
+class Histogram:
+    def __init__(self, buckets: list):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Cumulative buckets, as Prometheus expects
+    def lines(self, name: str, labels: str) -> list[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+class Metrics:
+    def __init__(self):
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS)) # (method, route) -> seconds
+        self.size = defaultdict(lambda: Histogram(SIZE_BUCKETS)) # (method, route) -> response bytes
+        self.requests = defaultdict(int) # (method, route, status) -> count
+        self.errors = defaultdict(int) # (method, route) -> unhandled exceptions
+        self.in_progress = 0
+
+    def record(self, method: str, route: str, status: int, seconds: float, size: int):
+        self.latency[method, route].observe(seconds)
+        self.size[method, route].observe(size)
+        self.requests[method, route, status] += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Requests handled, by route, method and status",
+            "# TYPE http_requests_total counter"
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_errors_total Requests that raised an unhandled exception",
+            "# TYPE http_request_errors_total counter"
+        ]
+        for (method, route), count in sorted(self.errors.items()):
+            lines.append(f"http_request_errors_total{{{_labels(method, route)}}} {count}")
+
+        lines += [
+            "# HELP http_request_duration_seconds Time from receiving a request to sending the end of its response",
+            "# TYPE http_request_duration_seconds histogram"
+        ]
+        for (method, route), histogram in sorted(self.latency.items()):
+            lines += histogram.lines("http_request_duration_seconds", _labels(method, route))
+
+        lines += [
+            "# HELP http_response_size_bytes Size of response bodies",
+            "# TYPE http_response_size_bytes histogram"
+        ]
+        for (method, route), histogram in sorted(self.size.items()):
+            lines += histogram.lines("http_response_size_bytes", _labels(method, route))
+
+        lines += [
+            "# HELP http_requests_in_progress Requests currently being handled",
+            "# TYPE http_requests_in_progress gauge",
+            f"http_requests_in_progress {self.in_progress}"
+        ]
+
+        return "\n".join(lines) + "\n"
+
+def _labels(method: str, route: str) -> str:
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+metrics = Metrics()
+
+# Pure ASGI middleware (rather than BaseHTTPMiddleware), so streaming responses pass straight through
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_and_measure(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_progress += 1
+        try:
+            await self.app(scope, receive, send_and_measure)
+        except Exception:
+            metrics.errors[scope["method"], _route(scope)] += 1
+            raise
+        finally:
+            metrics.in_progress -= 1
+            metrics.record(scope["method"], _route(scope), status, time.perf_counter() - start, size)
+
+# The matched route's path template (the router stores the route in the scope)
+def _route(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE) if route else UNMATCHED_ROUTE
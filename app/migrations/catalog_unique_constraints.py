@@ -0,0 +1,41 @@
+from sqlalchemy import inspect, text
+
+from ..database import engine
+
+# Adds the natural key unique constraints to existing profile, skills, education and experience tables
+# The create endpoints rely on them for INSERT ... ON CONFLICT DO NOTHING
+# Stops without changing anything if a table already has duplicates -- remove those first
+# python -m app.migrations.catalog_unique_constraints
+
+CONSTRAINTS = [
+    ("profile", "uq_profile_name", ["name"]),
+    ("skills", "uq_skills_category_name", ["category", "name"]),
+    ("education", "uq_education_school_degree_major", ["school", "degree", "major"]),
+    ("experience", "uq_experience_company_role", ["company", "role"])
+]
+
+def upgrade(connection):
+    for table, name, columns in CONSTRAINTS:
+        column_list = ", ".join(columns)
+        duplicates = connection.execute(text(f"SELECT {column_list}, COUNT(*) FROM {table} GROUP BY {column_list} HAVING COUNT(*) > 1")).all()
+
+        if duplicates:
+            raise SystemExit(f"Cannot add {name}, {table} has duplicates: {duplicates}")
+
+    inspector = inspect(connection)
+    for table, name, columns in CONSTRAINTS:
+        existing = [constraint["name"] for constraint in inspector.get_unique_constraints(table)]
+        existing += [index["name"] for index in inspector.get_indexes(table) if index["unique"]]
+        if name in existing:
+            continue
+
+        column_list = ", ".join(columns)
+        # SQLite can't add constraints to an existing table, but a unique index works the same for ON CONFLICT
+        if connection.dialect.name == "sqlite":
+            connection.execute(text(f"CREATE UNIQUE INDEX {name} ON {table} ({column_list})"))
+        else:
+            connection.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE ({column_list})"))
+
+if __name__ == "__main__":
+    with engine.begin() as connection:
+        upgrade(connection)
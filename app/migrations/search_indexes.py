@@ -0,0 +1,13 @@
+from ..database import engine
+from ..search import create_search_indexes
+
+# Adds the trigram search indexes to existing tables, replacing the stemmed full-text indexes if they're there
+# New databases get them from create_all() -- run this once against databases created before search was added
+# python -m app.migrations.search_indexes
+
+def upgrade(connection):
+    create_search_indexes(connection)
+
+if __name__ == "__main__":
+    with engine.begin() as connection:
+        upgrade(connection)
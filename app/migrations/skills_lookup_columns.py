@@ -0,0 +1,39 @@
+from sqlalchemy import inspect, text
+
+from ..database import engine
+
+# Adds the generated lower-case lookup columns (category_key, name_key) to an existing skills table,
+# and the indexes the skills filters use
+# python -m app.migrations.skills_lookup_columns
+
+COLUMNS = [
+    ("category_key", "lower(category)"),
+    ("name_key", "lower(name)")
+]
+
+INDEXES = {
+    "ix_skills_category_key_name_key": "category_key, name_key",
+    "ix_skills_name_key": "name_key"
+}
+
+def upgrade(connection):
+    inspector = inspect(connection)
+    existing = [column["name"] for column in inspector.get_columns("skills")]
+
+    for name, expression in COLUMNS:
+        if name in existing:
+            continue
+        # SQLite can only add VIRTUAL generated columns to an existing table (they can still be indexed)
+        if connection.dialect.name == "sqlite":
+            connection.execute(text(f"ALTER TABLE skills ADD COLUMN {name} VARCHAR NOT NULL GENERATED ALWAYS AS ({expression}) VIRTUAL"))
+        else:
+            connection.execute(text(f"ALTER TABLE skills ADD COLUMN {name} VARCHAR GENERATED ALWAYS AS ({expression}) STORED NOT NULL"))
+
+    existing_indexes = [index["name"] for index in inspector.get_indexes("skills")]
+    for name, columns in INDEXES.items():
+        if name not in existing_indexes:
+            connection.execute(text(f"CREATE INDEX {name} ON skills ({columns})"))
+
+if __name__ == "__main__":
+    with engine.begin() as connection:
+        upgrade(connection)
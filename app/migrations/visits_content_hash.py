@@ -0,0 +1,52 @@
+from sqlalchemy import inspect, text
+
+from ..database import engine
+from ..dedupe import visit_content_hash
+
+# Adds visits.content_hash, backfills it for existing visits, then adds its unique index
+# If there are already duplicate visits, the oldest one keeps the hash and the rest are left NULL
+# python -m app.migrations.visits_content_hash
+
+BATCH_SIZE = 1000
+
+def upgrade(connection):
+    columns = [column["name"] for column in inspect(connection).get_columns("visits")]
+    if "content_hash" not in columns:
+        connection.execute(text("ALTER TABLE visits ADD COLUMN content_hash VARCHAR(64)"))
+
+    # Hashes already in use (e.g. from visits created since the column was added)
+    seen = set(connection.execute(text("SELECT content_hash FROM visits WHERE content_hash IS NOT NULL")).scalars())
+    last_id = 0
+    backfilled = 0
+    duplicates = 0
+
+    while True:
+        rows = connection.execute(
+            text("SELECT id, name, relation, message FROM visits WHERE content_hash IS NULL AND id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE}).all()
+
+        if not rows:
+            break
+
+        updates = []
+        for id, name, relation, message in rows:
+            content_hash = visit_content_hash(name, relation, message)
+            if content_hash in seen:
+                duplicates += 1
+                continue
+            seen.add(content_hash)
+            updates.append({"id": id, "content_hash": content_hash})
+
+        if updates:
+            connection.execute(text("UPDATE visits SET content_hash = :content_hash WHERE id = :id"), updates)
+
+        backfilled += len(updates)
+        last_id = rows[-1].id
+
+    connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_visits_content_hash ON visits (content_hash)"))
+
+    print(f"Backfilled {backfilled} visits ({duplicates} duplicates left without a hash)")
+
+if __name__ == "__main__":
+    with engine.begin() as connection:
+        upgrade(connection)
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, String, Integer, DateTime, func
+from sqlalchemy import Column, String, Integer, DateTime, UniqueConstraint, Index, Computed, func
 from .database import Base
 
 class Profile(Base):
     __tablename__ = "profile"
+    __table_args__ = (UniqueConstraint("name", name="uq_profile_name"),)
 
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
     name = Column(String, nullable=False)
@@ -13,13 +14,28 @@ class Profile(Base):
 
 class Skills(Base):
     __tablename__ = "skills"
+    # The unique constraint also indexes (category, name) for ordered listing
+    # The lower-case lookup columns are indexed for case-insensitive filtering -- by category (and name),
+    # and by name alone, which the (category_key, name_key) index can't serve
+    __table_args__ = (
+        UniqueConstraint("category", "name", name="uq_skills_category_name"),
+        Index("ix_skills_category_key_name_key", "category_key", "name_key"),
+        Index("ix_skills_name_key", "name_key")
+    )
 
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
     category = Column(String, nullable=False)
     name = Column(String, nullable=False)
+    # Generated by the database, so they can never disagree with category and name
+    category_key = Column(String, Computed("lower(category)", persisted=True), nullable=False)
+    name_key = Column(String, Computed("lower(name)", persisted=True), nullable=False)
 
 class Education(Base):
     __tablename__ = "education"
+    # There may be multiple degrees from the same school, even multiple of the same degree type,
+    # but not both degree AND major
+    # e.g. Bachelor of Science, Computer Science and Bachelor of Science, Data Science
+    __table_args__ = (UniqueConstraint("school", "degree", "major", name="uq_education_school_degree_major"),)
 
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
     school = Column(String, nullable=False)
@@ -30,6 +46,7 @@ class Education(Base):
 
 class Experience(Base):
     __tablename__ = "experience"
+    __table_args__ = (UniqueConstraint("company", "role", name="uq_experience_company_role"),)
 
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
     company = Column(String, nullable=False)
@@ -44,4 +61,24 @@ class Visits(Base):
     name = Column(String, nullable=False)
     relation = Column(String, nullable=False)
     message = Column(String, nullable=False)
-    date = Column(DateTime(timezone=True), server_default=func.timezone('America/Los_Angeles', func.now()), nullable=False)
\ No newline at end of file
+    date = Column(DateTime(timezone=True), server_default=func.timezone('America/Los_Angeles', func.now()), nullable=False)
+    # Hash of the normalized name, relation and message (see app/dedupe.py), unique to reject duplicates on insert
+    content_hash = Column(String(64), unique=True, index=True)
+
+# Visit counts, kept up to date by every visit write (see app/visit_stats.py)
+# kind is "relation", "day" or "visitor", and key is the normalized relation, Pacific date or name
+class VisitStat(Base):
+    __tablename__ = "visit_stats"
+
+    kind = Column(String, primary_key=True, nullable=False)
+    key = Column(String, primary_key=True, nullable=False)
+    count = Column(Integer, nullable=False)
+
+# Version counter for each table above, bumped by every POST/PUT/DELETE
+# Drives the ETag and Last-Modified headers on the GET endpoints
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+
+    name = Column(String, primary_key=True, nullable=False)
+    version = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
\ No newline at end of file
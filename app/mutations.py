@@ -0,0 +1,22 @@
+from sqlalchemy import select, update, delete
+
+# Single-statement updates and deletes for the PUT and DELETE endpoints
+# Each runs one UPDATE ... RETURNING / DELETE ... RETURNING, instead of selecting the row, changing it
+# and refreshing it after the commit. No row back means nothing matched (404).
+# Unique constraint violations are raised by the statement itself (IntegrityError), rather than at commit.
+
+# Fields to write for a partial update: the ones the client sent, including falsy values like age=0
+# Nulls are skipped, since every column is NOT NULL
+def update_values(update_body, exclude: set[str] | None = None) -> dict:
+    return update_body.model_dump(exclude_unset=True, exclude_none=True, exclude=exclude)
+
+# Update the rows matching the condition, and return the first one as it is now (None if there isn't one)
+async def update_returning(db, model, condition, values: dict):
+    # Nothing to change -- just read the row
+    if not values:
+        return (await db.scalars(select(model).filter(condition))).first()
+    return (await db.scalars(update(model).filter(condition).values(**values).returning(model))).first()
+
+# Delete the rows matching the condition, and return the first one as it was (None if there wasn't one)
+async def delete_returning(db, model, condition):
+    return (await db.scalars(delete(model).filter(condition).returning(model))).first()
@@ -0,0 +1,72 @@
+from fastapi import HTTPException, Query
+from sqlalchemy import and_, or_
+import base64
+import json
+
+# Keyset (cursor) pagination
+# Results are ordered by id (newest first), and each page continues from the last id of the previous page,
+# so a page costs the same no matter how deep into the table it is.
+# Search results are ordered by relevance first, so their cursor also holds the last relevance seen.
+# The cursor is opaque to clients -- it is base64 encoded JSON, so the contents can change without breaking them.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100
+
+# Response header carrying the cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "Next-Cursor"
+
+limit_query = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description=f"(optional) Maximum number of results per page (1-{MAX_LIMIT})")
+cursor_query = Query(default=None, description=f"(optional) Cursor from the {NEXT_CURSOR_HEADER} header of the previous page")
+
+def encode_cursor(last_id: int, last_rank: float | None = None) -> str:
+    position = {"id": last_id}
+    if last_rank is not None:
+        position["rank"] = last_rank
+
+    payload = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        position = {"id": int(payload["id"])}
+        if "rank" in payload:
+            position["rank"] = float(payload["rank"])
+        return position
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+# Restrict a query to one page
+# Fetches one extra row so we know whether there is a next page without a COUNT query
+# If a rank (relevance) expression is given, it's added to the selected columns and rows are ordered by it
+def paginate(query, id_column, limit: int, cursor: str | None, rank=None):
+    position = decode_cursor(cursor) if cursor else None
+
+    if rank is None:
+        if position:
+            query = query.filter(id_column < position["id"])
+        return query.order_by(id_column.desc()).limit(limit + 1)
+
+    query = query.add_columns(rank.label("rank"))
+    if position:
+        last_rank = position.get("rank", 0.0)
+        query = query.filter(or_(rank < last_rank, and_(rank == last_rank, id_column < position["id"])))
+
+    return query.order_by(rank.desc(), id_column.desc()).limit(limit + 1)
+
+# Trim the extra row and build the cursor for the next page (None if this is the last page)
+# Takes the rows of the executed paginate() query (a column select including id), and returns them as dicts
+def next_page(rows: list, limit: int) -> tuple[list[dict], str | None]:
+    next_cursor = None
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(last["id"], last.get("rank"))
+
+    rows = [dict(row._mapping) for row in rows]
+    for row in rows:
+        row.pop("rank", None)
+
+    return rows, next_cursor
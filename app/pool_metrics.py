@@ -0,0 +1,76 @@
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import time
+
+# Live connection pool statistics for the API's engine, reported at /admin/pool
+# Connection, checkout and checkin counts come from pool events.
+# Checkout wait (how long a request waited for a free connection) is timed by the pool class itself,
+# since no event fires before a checkout starts waiting.
+# Each worker process has its own pool, so the numbers are for this worker only.
+
+class PoolMetrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.connections_created = 0
+        self.connections_invalidated = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.checkout_wait_total += seconds
+        self.checkout_wait_max = max(self.checkout_wait_max, seconds)
+
+    def stats(self, pool) -> dict:
+        waits = self.checkouts + self.checkout_timeouts
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "connections_created": self.connections_created,
+            "connections_invalidated": self.connections_invalidated,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "checkout_timeouts": self.checkout_timeouts,
+            "checkout_wait_avg_ms": self.checkout_wait_total / waits * 1000 if waits else 0.0,
+            "checkout_wait_max_ms": self.checkout_wait_max * 1000
+        }
+
+pool_metrics = PoolMetrics()
+
+# Queue pool (as used by the async drivers) that times how long each checkout waits
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.checkout_timeouts += 1
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+def instrument(engine):
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        pool_metrics.connections_created += 1
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics.checkouts += 1
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        pool_metrics.checkins += 1
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.connections_invalidated += 1
@@ -0,0 +1,103 @@
+from contextvars import ContextVar
+from sqlalchemy import event
+import json
+import logging
+import os
+import time
+
+# Per-request database statistics and a slow-query log, from engine events (instead of echo)
+# Each request counts its statements and the time spent running them, and reports both
+# in a Server-Timing header (db;dur=<ms>;desc="<n> queries"), which browser dev tools display.
+# Statements taking at least DB_SLOW_QUERY_MS milliseconds are logged as one JSON object per line
+# to the "app.slow_queries" logger, with the route that issued them (0 logs every statement, -1 turns it off).
+# Statements that fail are always logged (unless it's turned off), with the exception's type in "error".
+# Parameters are left out of the log, since they can hold visitors' messages.
+
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+
+slow_query_logger = logging.getLogger("app.slow_queries")
+
+class RequestQueries:
+    def __init__(self, scope):
+        self.scope = scope
+        self.statements = 0
+        self.seconds = 0.0
+
+    # The matched route's path template (the router stores the route in the scope)
+    def route(self) -> str | None:
+        route = self.scope.get("route")
+        return getattr(route, "path", None)
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.statements} queries"'
+
+# Statistics for the request being handled (None outside of a request, e.g. the write-behind task)
+current_queries: ContextVar[RequestQueries | None] = ContextVar("current_queries", default=None)
+
+def instrument_queries(engine):
+    # Start times are kept with their execution context, so a failed statement only pops its own
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_start", []).append((context, time.perf_counter()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        _, start = connection.info["query_start"].pop()
+        record_statement(time.perf_counter() - start, statement, executemany)
+
+    # Failed statements never reach after_cursor_execute -- count and log them here instead
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+        # Errors before the statement was sent (e.g. while connecting) have no start time to pop
+        if not starts or starts[-1][0] is not exception_context.execution_context:
+            return
+        _, start = starts.pop()
+        record_statement(
+            time.perf_counter() - start, exception_context.statement, exception_context.execution_context.executemany,
+            error=type(exception_context.original_exception).__name__
+        )
+
+# Add a statement to the current request's statistics, and log it if it was slow or failed
+def record_statement(seconds: float, statement: str, executemany: bool, error: str | None = None):
+    queries = current_queries.get()
+
+    if queries:
+        queries.statements += 1
+        queries.seconds += seconds
+
+    if DB_SLOW_QUERY_MS >= 0 and (error or seconds * 1000 >= DB_SLOW_QUERY_MS):
+        entry = {
+            "duration_ms": round(seconds * 1000, 1),
+            "route": queries.route() if queries else None,
+            "method": queries.scope["method"] if queries else None,
+            "statement": " ".join(statement.split()),
+            "executemany": executemany
+        }
+        if error:
+            entry["error"] = error
+        slow_query_logger.warning(json.dumps(entry))
+
+# Pure ASGI middleware that tracks each request's queries, and adds the Server-Timing header
+class QueryTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope)
+        token = current_queries.set(queries)
+
+        # Anything run after the response has started (e.g. a streamed export) isn't in the header
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", queries.server_timing().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_queries.reset(token)
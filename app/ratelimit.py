@@ -0,0 +1,86 @@
+from fastapi import HTTPException, Request
+import importlib
+import math
+import os
+import time
+
+# Admission control for the public POST /visits endpoint
+# Each client IP gets a token bucket: VISITS_RATE_LIMIT visits per minute, with bursts of up to VISITS_RATE_BURST.
+# At most VISITS_MAX_CONCURRENCY visits are handled at once across the worker, so they can't take every pooled connection.
+# Requests over either limit get 429 Too Many Requests with Retry-After, before a database session is used.
+# Set a limit to 0 to turn it off.
+#
+# Buckets are kept in memory by default, so each worker limits on its own. For a limit shared by every worker,
+# set RATE_LIMIT_BACKEND to "package.module:ClassName" -- a class with no constructor arguments and
+# `async def take(self, key: str, rate: float, burst: int) -> float`, which takes a token from the bucket
+# and returns 0, or returns how many seconds until one is available.
+#
+# Behind a proxy (Render, Vercel), every request comes from the proxy's address. Set RATE_LIMIT_PROXY_HOPS
+# to the number of proxies in front of the app to use the client address they add to X-Forwarded-For.
+
+VISITS_RATE_LIMIT = float(os.getenv("VISITS_RATE_LIMIT", 5)) # Per client, per minute
+VISITS_RATE_BURST = int(os.getenv("VISITS_RATE_BURST", 5))
+VISITS_MAX_CONCURRENCY = int(os.getenv("VISITS_MAX_CONCURRENCY", 5))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND")
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", 0))
+
+class MemoryBackend:
+    # Past this many clients, buckets that have refilled completely are dropped (they'd start full anyway)
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self.buckets = {} # key -> (tokens, last refill time)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, last = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+        self.buckets[key] = (tokens - 1, now)
+        if len(self.buckets) > self.MAX_BUCKETS:
+            self._prune(now, rate, burst)
+        return 0
+
+    def _prune(self, now: float, rate: float, burst: int):
+        for key in [key for key, (tokens, last) in self.buckets.items() if tokens + (now - last) * rate >= burst]:
+            del self.buckets[key]
+
+def load_backend(path: str | None):
+    if not path:
+        return MemoryBackend()
+    module, name = path.split(":")
+    return getattr(importlib.import_module(module), name)()
+
+backend = load_backend(RATE_LIMIT_BACKEND)
+
+def client_address(request: Request) -> str:
+    if RATE_LIMIT_PROXY_HOPS:
+        forwarded = [address.strip() for address in request.headers.get("x-forwarded-for", "").split(",") if address.strip()]
+        # Each proxy appends the address it received the request from, so count back from the end
+        if len(forwarded) >= RATE_LIMIT_PROXY_HOPS:
+            return forwarded[-RATE_LIMIT_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+in_flight = 0
+
+# Dependency for POST /visits -- list it before get_write_db, so rejected requests never touch the database
+async def limit_visits(request: Request):
+    global in_flight
+
+    if VISITS_MAX_CONCURRENCY and in_flight >= VISITS_MAX_CONCURRENCY:
+        raise HTTPException(status_code=429, detail="Too many visits right now, please try again shortly.", headers={"Retry-After": "1"})
+
+    # Reserve the slot before awaiting the backend, so requests checked while another is waiting on it can't all get in
+    in_flight += 1
+    try:
+        if VISITS_RATE_LIMIT:
+            wait = await backend.take(f"visits:{client_address(request)}", VISITS_RATE_LIMIT / 60, VISITS_RATE_BURST)
+            if wait:
+                raise HTTPException(status_code=429, detail="You're visiting too often, please try again later.", headers={"Retry-After": str(math.ceil(wait))})
+        yield
+    finally:
+        in_flight -= 1
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import APIKeyHeader
+
+from ..cache import catalog_cache
+from ..compression import compression_cache
+from ..database import get_async_engine
+from ..pool_metrics import pool_metrics
+import os
+
+router = APIRouter()
+
+api_key = os.getenv("API_KEY")
+header_scheme = APIKeyHeader(name="api_key")
+
+# GET
+# Hit/miss counters for the catalog cache (this worker only)
+@router.get("/admin/cache", tags=["Admin"])
+async def get_cache_stats(
+    key: str = Depends(header_scheme)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    return catalog_cache.stats()
+
+# DELETE
+# Empty the catalog cache (e.g. after editing the database by hand)
+@router.delete("/admin/cache", tags=["Admin"])
+async def clear_cache(
+    key: str = Depends(header_scheme)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    catalog_cache.clear()
+
+    return catalog_cache.stats()
+
+# GET
+# Connection pool statistics for the API's database engine (this worker only)
+@router.get("/admin/pool", tags=["Admin"])
+async def get_pool_stats(
+    key: str = Depends(header_scheme)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    return pool_metrics.stats(get_async_engine().pool)
+
+
+# GET
+# Hit/miss counters and size of the precompressed response cache (this worker only)
+@router.get("/admin/compression", tags=["Admin"])
+async def get_compression_stats(
+    key: str = Depends(header_scheme)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    return compression_cache.stats()
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, Body
 from fastapi.security import APIKeyHeader
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_read_db, get_write_db, dialect_insert
+from ..versions import bump_version, get_version, not_modified
+from ..pagination import NEXT_CURSOR_HEADER, limit_query, cursor_query, paginate, next_page
+from ..search import search
+from ..cache import catalog_cache
+from ..snapshot import snapshot, refresh_snapshot
+from ..serialization import response_columns, json_response, fields_query, parse_fields, select_fields
+from ..bulk import BULK_MAX_ITEMS, ids_query, parse_keys, bulk_create, batch_update, batch_delete
+from ..mutations import update_values, update_returning, delete_returning
 
 from ..models import Education
-from ..schemas import EducationCreate, EducationResponse, EducationUpdate
+from ..schemas import BatchItemResult, BulkItemResult, EducationBatchUpdate, EducationCreate, EducationResponse, EducationUpdate
 import os
 
 router = APIRouter()
@@ -13,47 +23,59 @@ api_key = os.getenv("API_KEY")
 header_scheme = APIKeyHeader(name="api_key")
 
 @router.post("/education", response_model=EducationCreate, tags=["Education"])
-def create_education(
+async def create_education(
     education: EducationCreate,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find existing education with same school, degree and major
-    # There may be multiple degrees from the same school, even multiple of the same degree type, 
-    # but not both degree AND major
-    # e.g. Bachelor of Science, Computer Science and Bachelor of Science, Data Science
-    existing_education = db.query(Education).filter(
-        Education.school == education.school, 
-        Education.degree == education.degree, 
-        Education.major == education.major).first()
-
-    if existing_education:
+    # Insert unless the natural key already exists (enforced by a unique constraint), in a single statement
+    statement = dialect_insert(db, Education).values(**education.model_dump()).on_conflict_do_nothing(index_elements=[Education.school, Education.degree, Education.major]).returning(Education)
+    new_education = (await db.scalars(statement)).first()
+
+    if not new_education:
         raise HTTPException(status_code=409, detail=f"{education.degree} in {education.major} already exists for {education.school}.")
-    
-    # Dump pydantic model into dictionary, unpack into keywords, format into SQLAlchemy model instance
-    new_education = Education(**education.model_dump())
 
-    # Add and commit SQLAlchemy model instance
-    db.add(new_education)
-    db.commit()
-    db.refresh(new_education)
+    await bump_version(db, "education")
+    await db.commit()
+    catalog_cache.invalidate("education")
+    await refresh_snapshot(db, "education")
 
     return new_education
 
-# GET
-@router.get("/education", response_model=list[EducationResponse], tags=["Education"])
-def get_education(
-    school: str | None = Query(default=None, description="(optional) Filter by school"),
-    degree: str | None = Query(default=None, description="(optional) Filter by degree"),
-    major: str | None = Query(default=None, description="(optional) Filter by major"),
-    description: str | None = Query(default=None, description="(optional) Search for keywords in descriptions"),
-    db: Session = Depends(get_db)):
+# POST (Bulk)
+# Create many education entries in one transaction, reporting created/conflict for each
+@router.post("/education/bulk", response_model=list[BulkItemResult], tags=["Education"])
+async def create_education_bulk(
+    education: list[EducationCreate] = Body(min_length=1, max_length=BULK_MAX_ITEMS),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    results = await bulk_create(db, Education, education, ["school", "degree", "major"])
+
+    await bump_version(db, "education")
+    await db.commit()
+    catalog_cache.invalidate("education")
+    await refresh_snapshot(db, "education")
+
+    return results
+
+# Select one page of education matching the filters
+async def query_education(db: AsyncSession, school, degree, major, description, limit: int, cursor: str | None, fields: tuple[str, ...] | None = None):
+
+    # Snapshot mode answers from memory, without touching the database
+    if snapshot:
+        education, next_cursor = snapshot.page("education", {"school": school, "degree": degree, "major": major}, description, limit, cursor)
+        return select_fields(education, fields), next_cursor
 
     # Query Education table
-    education = db.query(Education)
+    # Only the response columns (or the requested ones), so rows can be sent without re-validation
+    education = select(*response_columns(Education, EducationResponse, fields))
 
     if school:
         school = school.lower().title()
@@ -62,74 +84,153 @@ def get_education(
         degree = degree.lower().title()
         education = education.filter(Education.degree.ilike(f"%{degree}%"))
     if major:
-        major = degree.lower().title()
-        education = education.filter(Education.degree.ilike(f"%{major}%"))
+        major = major.lower().title()
+        education = education.filter(Education.major.ilike(f"%{major}%"))
+    # Text search goes through the trigram index, and ranks results by relevance
+    rank = None
     if description:
-        education = education.filter(Education.description.ilike(f"%{description}%"))
+        education, rank = search(education, Education, Education.description, description, db.bind.dialect.name)
+
+    # Select one page of results
+    education, next_cursor = next_page((await db.execute(paginate(education, Education.id, limit, cursor, rank))).all(), limit)
 
-    # Select all results
-    education = education.order_by(Education.id.desc()).all()
+    return education, next_cursor
+
+# GET
+@router.get("/education", response_model=list[EducationResponse], tags=["Education"])
+async def get_education(
+    request: Request,
+    response: Response,
+    school: str | None = Query(default=None, description="(optional) Filter by school"),
+    degree: str | None = Query(default=None, description="(optional) Filter by degree"),
+    major: str | None = Query(default=None, description="(optional) Filter by major"),
+    description: str | None = Query(default=None, description="(optional) Search descriptions for this text (case-insensitive)"),
+    limit: int = limit_query,
+    cursor: str | None = cursor_query,
+    fields: str | None = fields_query(EducationResponse),
+    db: AsyncSession = Depends(get_read_db)):
+
+    fields = parse_fields(fields, EducationResponse)
+
+    # Answer 304 Not Modified if the client's copy is still current
+    version = await get_version(db, "education", catalog_cache)
+    unchanged = not_modified(request, response, "education", version)
+    if unchanged:
+        return unchanged
+
+    # Serve repeated queries from the cache
+    # Keyed by the table version the ETag was built from, so the body always matches the ETag
+    cache_key = catalog_cache.key("education", school=school, degree=degree, major=major, description=description, limit=limit, cursor=cursor, fields=fields, version=version[0])
+    page = catalog_cache.get(cache_key)
+
+    if page is None:
+        page = await query_education(db, school, degree, major, description, limit, cursor, fields)
+        catalog_cache.set(cache_key, page)
+
+    education, next_cursor = page
 
     if not education:
         raise HTTPException(status_code=404, detail=f"No education found matching the provided parameters.")
     
-    return education
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return json_response(education, response)
 
 # PUT
 @router.put("/education/{id}", response_model=EducationUpdate, tags=["Education"])
-def update_education(
+async def update_education(
     id: int, #  Update by ID
     education_update: EducationUpdate,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find specified education
-    education = db.query(Education).filter(Education.id == id).first()
+    # Update specified education in one statement, replacing only the fields included in the update
+    try:
+        education = await update_returning(db, Education, Education.id == id, update_values(education_update))
+    except IntegrityError:
+        # School, degree and major must be unique
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Could not update. Another education entry already has that school, degree and major.")
 
     if not education:
         raise HTTPException(status_code=404, detail=f"Education with id {id} not found")
 
-    # Update education
-    if education_update.school:
-        education.school = education_update.school
-    if education_update.degree:
-        education.degree = education_update.degree
-    if education_update.major:
-        education.major = education_update.major
-    if education_update.dates:
-        education.dates = education_update.dates
-    if education_update.description:
-        education.description = education_update.description
-    
     # Commit changes to db
-    db.commit()
-    db.refresh(education)
+    await bump_version(db, "education")
+    await db.commit()
+    catalog_cache.invalidate("education")
+    await refresh_snapshot(db, "education")
 
     return education
 
 # DELETE
 @router.delete("/education/{id}", response_model=EducationResponse, tags=["Education"])
-def delete_education(
+async def delete_education(
     id: int, # Delete by ID
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find education with provided ID
-    education = db.query(Education).filter(Education.id == id).first()
+    # Delete education with provided ID, in one statement
+    education = await delete_returning(db, Education, Education.id == id)
 
     if not education:
         raise HTTPException(status_code=404, detail=f"Education with id {id} not found.")
 
-    # Delete education
-    db.delete(education)
-    db.commit()
+    await bump_version(db, "education")
+    await db.commit()
+    catalog_cache.invalidate("education")
+    await refresh_snapshot(db, "education")
 
     return education
 
-    
\ No newline at end of file
+# PATCH (Batch)
+# Update many education entries by ID in one transaction, reporting updated/not_found/conflict for each
+@router.patch("/education/batch", response_model=list[BatchItemResult], tags=["Education"])
+async def update_education_batch(
+    education: list[EducationBatchUpdate] = Body(min_length=1, max_length=BULK_MAX_ITEMS),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    try:
+        results, _ = await batch_update(db, Education, education, "id", ["school", "degree", "major"])
+    except IntegrityError:
+        # Conflicts are checked first, so this is a concurrent write taking one of the new values
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Could not update. The education entries changed during the update, please try again.")
+
+    await bump_version(db, "education")
+    await db.commit()
+    catalog_cache.invalidate("education")
+    await refresh_snapshot(db, "education")
+
+    return results
+
+# DELETE (Batch)
+# Delete many education entries by ID in one statement, reporting deleted/not_found for each
+@router.delete("/education", response_model=list[BatchItemResult], tags=["Education"])
+async def delete_education_batch(
+    ids: str = ids_query,
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    results, _ = await batch_delete(db, Education, parse_keys(ids))
+
+    await bump_version(db, "education")
+    await db.commit()
+    catalog_cache.invalidate("education")
+    await refresh_snapshot(db, "education")
+
+    return results
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, Body
 from fastapi.security import APIKeyHeader
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_read_db, get_write_db, dialect_insert
+from ..versions import bump_version, get_version, not_modified
+from ..pagination import NEXT_CURSOR_HEADER, limit_query, cursor_query, paginate, next_page
+from ..search import search
+from ..cache import catalog_cache
+from ..snapshot import snapshot, refresh_snapshot
+from ..serialization import response_columns, json_response, fields_query, parse_fields, select_fields
+from ..bulk import BULK_MAX_ITEMS, ids_query, parse_keys, bulk_create, batch_update, batch_delete
+from ..mutations import update_values, update_returning, delete_returning
 
 from ..models import Experience
-from ..schemas import ExperienceCreate, ExperienceResponse, ExperienceUpdate
+from ..schemas import BatchItemResult, BulkItemResult, ExperienceBatchUpdate, ExperienceCreate, ExperienceResponse, ExperienceUpdate
 import os
 
 router = APIRouter()
@@ -14,42 +24,59 @@ header_scheme = APIKeyHeader(name="api_key")
 
 # POST
 @router.post("/experience", response_model=ExperienceCreate, tags=["Experience"])
-def create_experience(
+async def create_experience(
     experience: ExperienceCreate,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
 
-    # Find existing experience with same company and role
-    existing_experience = db.query(Experience).filter(
-        Experience.company == experience.company, 
-        Experience.role == experience.role).first()
-    
-    if existing_experience:
+    # Insert unless the natural key already exists (enforced by a unique constraint), in a single statement
+    statement = dialect_insert(db, Experience).values(**experience.model_dump()).on_conflict_do_nothing(index_elements=[Experience.company, Experience.role]).returning(Experience)
+    new_experience = (await db.scalars(statement)).first()
+
+    if not new_experience:
         raise HTTPException(status_code=409, detail=f"{experience.role} already exists for {experience.company}.")
-    
-    # Dump pydantic model into dictionary, unpack into keywords, format into SQLAlchemy model instance
-    new_experience = Experience(**experience.model_dump())
 
-    # Add and commit SQLAlchemy model instance
-    db.add(new_experience)
-    db.commit()
-    db.refresh(new_experience)
+    await bump_version(db, "experience")
+    await db.commit()
+    catalog_cache.invalidate("experience")
+    await refresh_snapshot(db, "experience")
 
     return new_experience
 
-# GET
-@router.get("/experience", response_model=list[ExperienceResponse], tags=["Experience"])
-def get_experience(
-    company: str | None = Query(default=None, description="(optional) Filter by company"),
-    role: str | None = Query(default=None, description="(optional) Filter by role"),
-    description: str | None = Query(default=None, description="(optional) Search for keywords in descriptions"),
-    db: Session = Depends(get_db)):
+# POST (Bulk)
+# Create many experience entries in one transaction, reporting created/conflict for each
+@router.post("/experience/bulk", response_model=list[BulkItemResult], tags=["Experience"])
+async def create_experience_bulk(
+    experience: list[ExperienceCreate] = Body(min_length=1, max_length=BULK_MAX_ITEMS),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    results = await bulk_create(db, Experience, experience, ["company", "role"])
+
+    await bump_version(db, "experience")
+    await db.commit()
+    catalog_cache.invalidate("experience")
+    await refresh_snapshot(db, "experience")
+
+    return results
+
+# Select one page of experience matching the filters
+async def query_experience(db: AsyncSession, company, role, description, limit: int, cursor: str | None, fields: tuple[str, ...] | None = None):
+
+    # Snapshot mode answers from memory, without touching the database
+    if snapshot:
+        experience, next_cursor = snapshot.page("experience", {"company": company, "role": role}, description, limit, cursor)
+        return select_fields(experience, fields), next_cursor
 
     # Query experience table
-    experience = db.query(Experience)
+    # Only the response columns (or the requested ones), so rows can be sent without re-validation
+    experience = select(*response_columns(Experience, ExperienceResponse, fields))
 
     if company:
         company = company.lower().title()
@@ -57,68 +84,150 @@ def get_experience(
     if role:
         role = role.lower().title()
         experience = experience.filter(Experience.role.ilike(f"%{role}%"))
+    # Text search goes through the trigram index, and ranks results by relevance
+    rank = None
     if description:
-        experience = experience.filter(Experience.description.ilike(f"%{description}%"))
+        experience, rank = search(experience, Experience, Experience.description, description, db.bind.dialect.name)
     
-    # Select all results
-    experience = experience.order_by(Experience.id.desc()).all()
+    # Select one page of results
+    experience, next_cursor = next_page((await db.execute(paginate(experience, Experience.id, limit, cursor, rank))).all(), limit)
+
+    return experience, next_cursor
+
+# GET
+@router.get("/experience", response_model=list[ExperienceResponse], tags=["Experience"])
+async def get_experience(
+    request: Request,
+    response: Response,
+    company: str | None = Query(default=None, description="(optional) Filter by company"),
+    role: str | None = Query(default=None, description="(optional) Filter by role"),
+    description: str | None = Query(default=None, description="(optional) Search descriptions for this text (case-insensitive)"),
+    limit: int = limit_query,
+    cursor: str | None = cursor_query,
+    fields: str | None = fields_query(ExperienceResponse),
+    db: AsyncSession = Depends(get_read_db)):
+
+    fields = parse_fields(fields, ExperienceResponse)
+
+    # Answer 304 Not Modified if the client's copy is still current
+    version = await get_version(db, "experience", catalog_cache)
+    unchanged = not_modified(request, response, "experience", version)
+    if unchanged:
+        return unchanged
+
+    # Serve repeated queries from the cache
+    # Keyed by the table version the ETag was built from, so the body always matches the ETag
+    cache_key = catalog_cache.key("experience", company=company, role=role, description=description, limit=limit, cursor=cursor, fields=fields, version=version[0])
+    page = catalog_cache.get(cache_key)
+
+    if page is None:
+        page = await query_experience(db, company, role, description, limit, cursor, fields)
+        catalog_cache.set(cache_key, page)
+
+    experience, next_cursor = page
 
     if not experience:
         raise HTTPException(status_code=404, detail=f"No experience found matching the provided parameters.")
     
-    return experience
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return json_response(experience, response)
 
 # PUT
 @router.put("/experience/{id}", response_model=ExperienceUpdate, tags=["Experience"])
-def update_experience(
+async def update_experience(
     id: int, # Update by ID
     experience_update: ExperienceUpdate,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find specified experience
-    experience = db.query(Experience).filter(Experience.id == id).first()
+    # Update specified experience in one statement, replacing only the fields included in the update
+    try:
+        experience = await update_returning(db, Experience, Experience.id == id, update_values(experience_update))
+    except IntegrityError:
+        # Company and role must be unique
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Could not update. Another experience entry already has that company and role.")
 
     if not experience:
         raise HTTPException(status_code=404, detail=f"Experience with id {id} not found.")
-    
-    # Update experience
-    if experience_update.company:
-        experience.company = experience_update.company
-    if experience_update.role:
-        experience.role = experience_update.role
-    if experience_update.dates:
-        experience.dates = experience_update.dates
-    if experience_update.description:
-        experience.description = experience_update.description
-    
+
     # Commit changes to db
-    db.commit()
-    db.refresh(experience)
+    await bump_version(db, "experience")
+    await db.commit()
+    catalog_cache.invalidate("experience")
+    await refresh_snapshot(db, "experience")
 
     return experience
 
 # DELETE
 @router.delete("/experience/{id}", response_model=ExperienceResponse, tags=["Experience"])
-def delete_experience(
+async def delete_experience(
     id: int, # Delete by ID
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find experience with provided ID
-    experience = db.query(Experience).filter(Experience.id == id).first()
+    # Delete experience with provided ID, in one statement
+    experience = await delete_returning(db, Experience, Experience.id == id)
 
     if not experience:
         raise HTTPException(status_code=404, detail=f"Experience with id {id} not found.")
-    
-    # Delete experience
-    db.delete(experience)
-    db.commit()
 
-    return experience
\ No newline at end of file
+    await bump_version(db, "experience")
+    await db.commit()
+    catalog_cache.invalidate("experience")
+    await refresh_snapshot(db, "experience")
+
+    return experience
+
+# PATCH (Batch)
+# Update many experience entries by ID in one transaction, reporting updated/not_found/conflict for each
+@router.patch("/experience/batch", response_model=list[BatchItemResult], tags=["Experience"])
+async def update_experience_batch(
+    experience: list[ExperienceBatchUpdate] = Body(min_length=1, max_length=BULK_MAX_ITEMS),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    try:
+        results, _ = await batch_update(db, Experience, experience, "id", ["company", "role"])
+    except IntegrityError:
+        # Conflicts are checked first, so this is a concurrent write taking one of the new values
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Could not update. The experience entries changed during the update, please try again.")
+
+    await bump_version(db, "experience")
+    await db.commit()
+    catalog_cache.invalidate("experience")
+    await refresh_snapshot(db, "experience")
+
+    return results
+
+# DELETE (Batch)
+# Delete many experience entries by ID in one statement, reporting deleted/not_found for each
+@router.delete("/experience", response_model=list[BatchItemResult], tags=["Experience"])
+async def delete_experience_batch(
+    ids: str = ids_query,
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    results, _ = await batch_delete(db, Experience, parse_keys(ids))
+
+    await bump_version(db, "experience")
+    await db.commit()
+    catalog_cache.invalidate("experience")
+    await refresh_snapshot(db, "experience")
+
+    return results
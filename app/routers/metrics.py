@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from ..metrics import metrics
+
+router = APIRouter()
+
+# GET
+# Prometheus scrape endpoint (this worker only), left out of the API docs
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
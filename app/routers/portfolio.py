@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Query, Request
+from typing import Literal
+import asyncio
+
+from ..database import ReadSessionLocal, read_from_primary
+from ..cache import catalog_cache
+from ..serialization import json_response
+from ..pagination import MAX_LIMIT
+from ..schemas import PortfolioResponse
+from .profile import query_profile
+from .skills import query_skills
+from .education import query_education
+from .experience import query_experience
+
+router = APIRouter()
+
+SECTIONS = ["profile", "skills", "education", "experience"]
+
+# Every row of a paginated section, one MAX_LIMIT page at a time (a single query unless the history is that long)
+async def query_all(db, query_page) -> list[dict]:
+    rows, cursor = [], None
+    while True:
+        page, cursor = await query_page(db, cursor)
+        rows += page
+        if not cursor:
+            return rows
+
+# Load one section, in full
+# Sections are cached under their own keys in the catalog cache, so writes to a table invalidate them with its endpoint's entries
+# Each section gets its own session, so the queries can run at the same time
+async def load_section(section: str, primary: bool):
+    if section == "profile":
+        cache_key, query = catalog_cache.key("profile"), query_profile
+    elif section == "skills":
+        cache_key, query = catalog_cache.key("skills"), lambda db: query_skills(db, None, None)
+    elif section == "education":
+        cache_key, query = catalog_cache.key("education", portfolio=True), lambda db: query_all(db, lambda db, cursor: query_education(db, None, None, None, None, MAX_LIMIT, cursor))
+    else:
+        cache_key, query = catalog_cache.key("experience", portfolio=True), lambda db: query_all(db, lambda db, cursor: query_experience(db, None, None, None, MAX_LIMIT, cursor))
+
+    result = catalog_cache.get(cache_key)
+
+    if result is None:
+        async with ReadSessionLocal(primary=primary) as db:
+            result = await query(db)
+        catalog_cache.set(cache_key, result)
+
+    return result
+
+# GET
+@router.get("/portfolio", response_model=PortfolioResponse, response_model_exclude_none=True, tags=["Portfolio"])
+async def get_portfolio(
+    request: Request,
+    sections: list[Literal["profile", "skills", "education", "experience"]] | None = Query(default=None, description="(optional) Sections to include, e.g. ?sections=profile&sections=skills (default: all)")):
+
+    sections = sections or SECTIONS
+
+    # Query every requested section concurrently (cached sections don't touch the database)
+    # Each section is read from the replica, unless its table or this client was just written to
+    results = await asyncio.gather(*(load_section(section, read_from_primary(request, [section])) for section in sections))
+
+    # Leave out missing sections (no profile yet), as response_model_exclude_none did
+    return json_response({section: result for section, result in zip(sections, results) if result is not None})
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, Body
 from fastapi.security import APIKeyHeader
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_read_db, get_write_db, dialect_insert
+from ..versions import bump_version, get_version, not_modified
+from ..cache import catalog_cache
+from ..snapshot import snapshot, refresh_snapshot
+from ..serialization import response_columns, json_response
+from ..mutations import update_values, update_returning, delete_returning
+from ..bulk import BULK_MAX_ITEMS, parse_keys, batch_update, batch_delete
 
 from ..models import Profile
-from ..schemas import ProfileCreate, ProfileResponse, ProfileUpdate
+from ..schemas import BatchItemResult, ProfileCreate, ProfileResponse, ProfileUpdate
 
 import os
 
@@ -15,95 +22,156 @@ header_scheme = APIKeyHeader(name="api_key")
 
 # POST
 @router.post("/profile", response_model=ProfileResponse, tags=["Profile"])
-def create_profile(
+async def create_profile(
     profile: ProfileCreate,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find profile with same name
-    existing_profile = db.query(Profile).filter(Profile.name == profile.name).first()
+    # Insert unless the natural key already exists (enforced by a unique constraint), in a single statement
+    statement = dialect_insert(db, Profile).values(**profile.model_dump()).on_conflict_do_nothing(index_elements=[Profile.name]).returning(Profile)
+    new_profile = (await db.scalars(statement)).first()
 
-    if existing_profile:
+    if not new_profile:
         raise HTTPException(status_code=409, detail=f"A profile for {profile.name} already exists.")
-    
-    # Dump pydantic model into dictionary, unpack into keywords, format into SQLAlchemy model instance
-    new_profile = Profile(**profile.model_dump())
 
-    # Add and commit SQLAlchemy model instance
-    db.add(new_profile)
-    db.commit()
-    db.refresh(new_profile)
+    await bump_version(db, "profile")
+    await db.commit()
+    catalog_cache.invalidate("profile")
+    await refresh_snapshot(db, "profile")
 
     return new_profile
 
-# GET
-@router.get("/profile", response_model=ProfileResponse, tags=["Profile"])
-def get_profile(
-    db: Session = Depends(get_db)):
-    
+# Select the profile (None if there isn't one yet)
+async def query_profile(db: AsyncSession):
+
+    # Snapshot mode answers from memory, without touching the database
+    if snapshot:
+        return snapshot.profile()
+
     # Query profile table
-    profile = db.query(Profile)
+    # Only the response columns, so the row can be sent without re-validation
+    profile = select(*response_columns(Profile, ProfileResponse))
 
     # Select result
-    profile = profile.first()
+    profile = (await db.execute(profile)).mappings().first()
+
+    return dict(profile) if profile else None
+
+# GET
+@router.get("/profile", response_model=ProfileResponse, tags=["Profile"])
+async def get_profile(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db)):
+
+    # Answer 304 Not Modified if the client's copy is still current
+    version = await get_version(db, "profile", catalog_cache)
+    unchanged = not_modified(request, response, "profile", version)
+    if unchanged:
+        return unchanged
+
+    # Serve from the cache if the profile was read recently
+    # Keyed by the table version the ETag was built from, so the body always matches the ETag
+    cache_key = catalog_cache.key("profile", version=version[0])
+    profile = catalog_cache.get(cache_key)
+
+    if profile is None:
+        profile = await query_profile(db)
+        catalog_cache.set(cache_key, profile)
 
     if not profile:
         raise HTTPException(status_code=404, detail="Profile is unavailable.")
 
-    return profile
+    return json_response(profile, response)
 
 # PUT (Update)
 @router.put("/profile/{name}", response_model=ProfileUpdate, tags=["Profile"])
-def update_profile(
+async def update_profile(
     name: str, # Must include name in query
     profile_update: ProfileUpdate, # Schema components to update
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
 
-    # Find profile with provided name
-    profile = db.query(Profile).filter(Profile.name == name).first()
+    # Update the profile with provided name, in one statement
+    # Only the fields included in the update are replaced (the name identifies the profile, so it isn't changed)
+    profile = await update_returning(db, Profile, Profile.name == name, update_values(profile_update, exclude={"name"}))
 
     if not profile:
         raise HTTPException(status_code=404, detail=f"No profile found for {name}.")
 
-    # If update includes parameters, replace them in db instance
-    if profile_update.age:
-        profile.age = profile_update.age
-    if profile_update.about:
-        profile.about = profile_update.about
-    if profile_update.favorite_color:
-        profile.favorite_color = profile_update.favorite_color
-    if profile_update.favorite_food:
-        profile.favorite_food = profile_update.favorite_food
-    
-    db.commit()
-    db.refresh(profile)
+    await bump_version(db, "profile")
+    await db.commit()
+    catalog_cache.invalidate("profile")
+    await refresh_snapshot(db, "profile")
 
     return profile
 
 # DELETE
 @router.delete("/profile/{name}", response_model=ProfileResponse, tags=["Profile"])
-def delete_profile(
+async def delete_profile(
     name: str, # Name of profile to delete
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
 
-    # Find profile with provided name
-    profile = db.query(Profile).filter(Profile.name == name).first()
+    # Delete profile with provided name, in one statement
+    profile = await delete_returning(db, Profile, Profile.name == name)
 
     if not profile:
         raise HTTPException(status_code=404, detail=f"No profile found for {name}.")
-    
-    db.delete(profile)
-    db.commit()
 
-    return profile
\ No newline at end of file
+    await bump_version(db, "profile")
+    await db.commit()
+    catalog_cache.invalidate("profile")
+    await refresh_snapshot(db, "profile")
+
+    return profile
+
+# PATCH (Batch)
+# Update many profiles by name in one transaction, reporting updated/not_found for each
+@router.patch("/profile/batch", response_model=list[BatchItemResult], tags=["Profile"])
+async def update_profile_batch(
+    profiles: list[ProfileUpdate] = Body(min_length=1, max_length=BULK_MAX_ITEMS),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    # Names identify the profiles, so they aren't changed (and can't conflict)
+    results, _ = await batch_update(db, Profile, profiles, "name", ["name"])
+
+    await bump_version(db, "profile")
+    await db.commit()
+    catalog_cache.invalidate("profile")
+    await refresh_snapshot(db, "profile")
+
+    return results
+
+# DELETE (Batch)
+# Delete many profiles by name in one statement, reporting deleted/not_found for each
+@router.delete("/profile", response_model=list[BatchItemResult], tags=["Profile"])
+async def delete_profile_batch(
+    names: str = Query(description=f"Comma-separated names (at most {BULK_MAX_ITEMS})"),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    results, _ = await batch_delete(db, Profile, parse_keys(names, str), "name")
+
+    await bump_version(db, "profile")
+    await db.commit()
+    catalog_cache.invalidate("profile")
+    await refresh_snapshot(db, "profile")
+
+    return results
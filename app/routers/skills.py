@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, Body
+from itertools import groupby
+from typing import Literal
 from fastapi.security import APIKeyHeader
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_read_db, get_write_db, dialect_insert
+from ..versions import bump_version, get_version, not_modified
+from ..cache import catalog_cache
+from ..snapshot import snapshot, refresh_snapshot
+from ..serialization import response_columns, json_response, fields_query, parse_fields, select_fields
+from ..bulk import BULK_MAX_ITEMS, ids_query, parse_keys, bulk_create, batch_update, batch_delete
+from ..mutations import update_values, update_returning, delete_returning
 
 from ..models import Skills
-from ..schemas import SkillCreate, SkillResponse, SkillUpdate
+from ..schemas import BatchItemResult, BulkItemResult, SkillBatchUpdate, SkillCreate, SkillResponse, SkillUpdate
 
 import os
 
@@ -15,106 +25,204 @@ header_scheme = APIKeyHeader(name="api_key")
 
 # POST
 @router.post("/skills", response_model=SkillCreate, tags=["Skills"])
-def create_skill(
+async def create_skill(
     skill: SkillCreate,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
     
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find existing skill with same name and category
-    existing_skill = db.query(Skills).filter(Skills.category == skill.category, Skills.name == skill.name).first()
+    # Insert unless the natural key already exists (enforced by a unique constraint), in a single statement
+    statement = dialect_insert(db, Skills).values(**skill.model_dump()).on_conflict_do_nothing(index_elements=[Skills.category, Skills.name]).returning(Skills)
+    new_skill = (await db.scalars(statement)).first()
 
-    if existing_skill:
+    if not new_skill:
         raise HTTPException(status_code=409, detail=f"{skill.name} already exists in {skill.category}.")
-    
-    # Dump pydantic model into dictionary, unpack into keywords, format into SQLAlchemy model instance
-    new_skill = Skills(**skill.model_dump())
 
-    # Add and commit SQLAlchemy model instance
-    db.add(new_skill)
-    db.commit()
-    db.refresh(new_skill)
+    await bump_version(db, "skills")
+    await db.commit()
+    catalog_cache.invalidate("skills")
+    await refresh_snapshot(db, "skills")
 
     return new_skill
 
-# GET
-@router.get("/skills", response_model=list[SkillResponse], tags=["Skills"])
-def get_skills(
-    category: str | None = Query(default=None, description="(optional) Filter by category"),
-    name: str | None = Query(default=None, description="(optional) Filter by skill"),
-    db: Session = Depends(get_db)):
+# POST (Bulk)
+# Create many skills in one transaction, reporting created/conflict for each
+@router.post("/skills/bulk", response_model=list[BulkItemResult], tags=["Skills"])
+async def create_skills_bulk(
+    skills: list[SkillCreate] = Body(min_length=1, max_length=BULK_MAX_ITEMS),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    results = await bulk_create(db, Skills, skills, ["category", "name"])
+
+    await bump_version(db, "skills")
+    await db.commit()
+    catalog_cache.invalidate("skills")
+    await refresh_snapshot(db, "skills")
+
+    return results
+
+# Select all skills matching the filters
+async def query_skills(db: AsyncSession, category, name, fields: tuple[str, ...] | None = None):
+
+    # Snapshot mode answers from memory, without touching the database
+    if snapshot:
+        return select_fields(snapshot.skills(category, name), fields)
 
     # Query skills table
-    skills = db.query(Skills)
+    # Only the response columns (or the requested ones), so rows can be sent without re-validation
+    skills = select(*response_columns(Skills, SkillResponse, fields))
 
+    # Case-insensitive, through the index on the lower-case lookup columns
     if category:
-        category = category.lower().title()
-        skills = skills.filter(Skills.category == category)
+        skills = skills.filter(Skills.category_key == func.lower(category))
     if name:
-        name = name.lower().title()
-        skills = skills.filter(Skills.name == name)
+        skills = skills.filter(Skills.name_key == func.lower(name))
 
-    # Select all results
-    skills = skills.order_by(Skills.category, Skills.id).all()
+    # Select all results, in the order of the (category, name) unique index
+    skills = (await db.execute(skills.order_by(Skills.category, Skills.name))).mappings().all()
+
+    return [dict(skill) for skill in skills]
+
+# GET
+@router.get("/skills", response_model=list[SkillResponse] | dict[str, list[SkillResponse]], tags=["Skills"])
+async def get_skills(
+    request: Request,
+    response: Response,
+    category: str | None = Query(default=None, description="(optional) Filter by category"),
+    name: str | None = Query(default=None, description="(optional) Filter by skill"),
+    group_by: Literal["category"] | None = Query(default=None, description="(optional) Return {category: [skills]} instead of a list"),
+    fields: str | None = fields_query(SkillResponse),
+    db: AsyncSession = Depends(get_read_db)):
+
+    fields = parse_fields(fields, SkillResponse)
+    # Grouping needs the category, even if it isn't returned
+    selected = fields + ("category",) if fields and group_by == "category" and "category" not in fields else fields
+
+    # Answer 304 Not Modified if the client's copy is still current
+    version = await get_version(db, "skills", catalog_cache)
+    unchanged = not_modified(request, response, "skills", version)
+    if unchanged:
+        return unchanged
+
+    # Serve repeated queries from the cache
+    # Keyed by the table version the ETag was built from, so the body always matches the ETag
+    # Filters are case-insensitive, so they are in the key too
+    cache_key = catalog_cache.key("skills", category=category and category.lower(), name=name and name.lower(), fields=selected, version=version[0])
+    skills = catalog_cache.get(cache_key)
+
+    if skills is None:
+        skills = await query_skills(db, category, name, selected)
+        catalog_cache.set(cache_key, skills)
 
     if not skills:
         raise HTTPException(status_code=404, detail=f"No skills found matching the provided parameters.")
 
-    return skills
+    # Skills are already ordered by category, so each category is one run
+    if group_by == "category":
+        return json_response({category: select_fields(list(group), fields) for category, group in groupby(skills, key=lambda skill: skill["category"])}, response)
+
+    return json_response(skills, response)
 
 # PUT
 @router.put("/skills/{id}", response_model=SkillUpdate, tags=["Skills"])
-def update_skill(
+async def update_skill(
     id: int, # Update by ID, since name and category are not unique
     skill_update: SkillUpdate,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
 
-    # Find specified skill
-    skill = db.query(Skills).filter(Skills.id == id).first()
+    # Update specified skill in one statement, replacing only the fields included in the update
+    try:
+        skill = await update_returning(db, Skills, Skills.id == id, update_values(skill_update))
+    except IntegrityError:
+        # Category and name must be unique
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Could not update. Another skill already has that category and name.")
 
     if not skill:
         raise HTTPException(status_code=404, detail=f"Skill with id {id} not found.")
-    
-    # Ensure a skill does not already exist with updated info
-    existing_skill = db.query(Skills).filter(Skills.category == skill_update.category, Skills.name == skill_update.name).first()
-
-    if existing_skill:
-        raise HTTPException(status_code=409, detail=f"Could not update. {skill_update.name} already exists in {skill_update.category}.")
-
-    # Update skill
-    skill.category = skill_update.category
-    skill.name = skill_update.name
 
     # Commit changes to db
-    db.commit()
-    db.refresh(skill)
+    await bump_version(db, "skills")
+    await db.commit()
+    catalog_cache.invalidate("skills")
+    await refresh_snapshot(db, "skills")
 
     return skill
 
 # DELETE
 @router.delete("/skills/{id}", response_model=SkillResponse, tags=["Skills"])
-def delete_skill(
+async def delete_skill(
     id: int,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
 
-    # Find skill with provided name
-    skill = db.query(Skills).filter(Skills.id == id).first()
+    # Delete skill with provided ID, in one statement
+    skill = await delete_returning(db, Skills, Skills.id == id)
 
     if not skill:
         raise HTTPException(status_code=404, detail=f"Skill with id {id} not found.")
-    
-    # Delete skill
-    db.delete(skill)
-    db.commit()
 
-    return skill
\ No newline at end of file
+    await bump_version(db, "skills")
+    await db.commit()
+    catalog_cache.invalidate("skills")
+    await refresh_snapshot(db, "skills")
+
+    return skill
+
+# PATCH (Batch)
+# Update many skills by ID in one transaction, reporting updated/not_found/conflict for each
+@router.patch("/skills/batch", response_model=list[BatchItemResult], tags=["Skills"])
+async def update_skills_batch(
+    skills: list[SkillBatchUpdate] = Body(min_length=1, max_length=BULK_MAX_ITEMS),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    try:
+        results, _ = await batch_update(db, Skills, skills, "id", ["category", "name"])
+    except IntegrityError:
+        # Conflicts are checked first, so this is a concurrent write taking one of the new values
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Could not update. The skills changed during the update, please try again.")
+
+    await bump_version(db, "skills")
+    await db.commit()
+    catalog_cache.invalidate("skills")
+    await refresh_snapshot(db, "skills")
+
+    return results
+
+# DELETE (Batch)
+# Delete many skills by ID in one statement, reporting deleted/not_found for each
+@router.delete("/skills", response_model=list[BatchItemResult], tags=["Skills"])
+async def delete_skills_batch(
+    ids: str = ids_query,
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    results, _ = await batch_delete(db, Skills, parse_keys(ids))
+
+    await bump_version(db, "skills")
+    await db.commit()
+    catalog_cache.invalidate("skills")
+    await refresh_snapshot(db, "skills")
+
+    return results
@@ -1,137 +1,280 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, Body
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_read_db, get_write_db, dialect_insert
+from ..dedupe import visit_content_hash
+from ..versions import bump_version, get_version, not_modified
+from ..pagination import NEXT_CURSOR_HEADER, limit_query, cursor_query, paginate, next_page
+from ..search import search
+from ..visit_buffer import visit_buffer
+from ..ratelimit import limit_visits
+from ..visit_stats import pacific, visit_deltas, apply_deltas, get_stats
+from ..serialization import response_columns, json_response, fields_query, parse_fields
+from ..export import EXPORT_FORMATS, stream_export
+from ..mutations import update_values, update_returning, delete_returning
+from ..bulk import BULK_MAX_ITEMS, ids_query, parse_keys, batch_update, batch_delete
 
-from pytz import timezone
-import pytz
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Literal
 
 from ..models import Visits
-from ..schemas import VisitCreate, VisitResponse, VisitUpdate
+from ..schemas import BatchItemResult, VisitBatchUpdate, VisitCreate, VisitResponse, VisitUpdate, VisitStatsResponse
 import os
 
 router = APIRouter()
 
 api_key = os.getenv("API_KEY")
 header_scheme = APIKeyHeader(name="api_key")
-pacific = timezone("America/Los_Angeles")
 
 # POST
 @router.post("/visits", response_model=VisitCreate, tags=["Visits"])
-def create_visit(
+async def create_visit(
     visit: VisitCreate,
-    # No API key required to visit!
-    db: Session = Depends(get_db)):
-
-    # Find EXACT duplicate entry (same name, relation AND message)
-    existing_visit = db.query(Visits).filter(
-        Visits.name == visit.name,
-        Visits.relation == visit.relation,
-        Visits.message == visit.message).first()
-    
-    if existing_visit:
-        raise HTTPException(status_code=404, detail=f"{visit.name} already has a visit with the message '{visit.message}'.")
-    
+    # No API key required to visit! (but visits are rate limited, see app/ratelimit.py)
+    admitted: None = Depends(limit_visits),
+    db: AsyncSession = Depends(get_write_db)):
+
     # Prevent default SwaggerUI submission
     if visit.name == "string" or visit.relation == "string" or visit.message == "string":
         raise HTTPException(status_code=422, detail="Default values are not allowed. (e.g. you submitted a visit with 'string' as one of the values)")
 
-    # Dump pydantic model into dictionary, unpack into keywords, format into SQLAlchemy model instance
-    new_visit = Visits(**visit.model_dump(exclude="date"))
+    # Duplicates (same name, relation AND message) are detected by the unique index on the content hash
+    new_visit = visit.model_dump()
+    new_visit["content_hash"] = visit_content_hash(visit.name, visit.relation, visit.message)
+    duplicate = HTTPException(status_code=404, detail=f"{visit.name} already has a visit with the message '{visit.message}'.")
+
+    # In write-behind mode, queue the visit to be written with the next batch
+    if visit_buffer:
+        # Indexed lookup, so duplicates still get an answer -- the batch insert skips any that slip through
+        if (await db.scalars(select(Visits.id).filter(Visits.content_hash == new_visit["content_hash"]))).first():
+            raise duplicate
+        if not visit_buffer.enqueue(new_visit):
+            raise HTTPException(status_code=503, detail="Too many visits right now, please try again shortly.", headers={"Retry-After": "1"})
+        return JSONResponse(status_code=202, content=visit.model_dump())
 
-    # Add and commit SQLAlchemy model instance
-    db.add(new_visit)
-    db.commit()
-    db.refresh(new_visit)
+    # Insert unless the content hash already exists, in a single statement
+    statement = dialect_insert(db, Visits).values(**new_visit).on_conflict_do_nothing(index_elements=[Visits.content_hash]).returning(Visits)
+    new_visit = (await db.scalars(statement)).first()
+
+    if not new_visit:
+        raise duplicate
+
+    await apply_deltas(db, visit_deltas([new_visit]))
+    await bump_version(db, "visits")
+    await db.commit()
 
     return new_visit
 
 # GET
 @router.get("/visits", response_model=list[VisitResponse], tags=["Visits"])
-def get_visits(
+async def get_visits(
+    request: Request,
+    response: Response,
     name: str | None = Query(default=None, description="(optional) Filter by name"),
     relation: str | None = Query(default=None, description="(optional) Filter by relation"),
-    message: str | None = Query(default=None, description="(optional) Search for keywords in messages"),
-    db: Session = Depends(get_db)):
+    message: str | None = Query(default=None, description="(optional) Search messages for this text (case-insensitive)"),
+    limit: int = limit_query,
+    cursor: str | None = cursor_query,
+    fields: str | None = fields_query(VisitResponse),
+    db: AsyncSession = Depends(get_read_db)):
+
+    fields = parse_fields(fields, VisitResponse)
+
+    # Answer 304 Not Modified if the client's copy is still current
+    unchanged = not_modified(request, response, "visits", await get_version(db, "visits"))
+    if unchanged:
+        return unchanged
 
     # Query visits table
-    visits = db.query(Visits)
+    # Only the response columns (or the requested ones), so rows can be sent without re-validation
+    visits = select(*response_columns(Visits, VisitResponse, fields))
 
     if name:
         visits = visits.filter(Visits.name.ilike(f"%{name}%"))
     if relation:
         visits = visits.filter(Visits.relation.ilike(f"%{relation}%"))
+    # Text search goes through the trigram index, and ranks results by relevance
+    rank = None
     if message:
-        visits = visits.filter(Visits.message.ilike(f"%{message}%"))
+        visits, rank = search(visits, Visits, Visits.message, message, db.bind.dialect.name)
 
-    # Select all results
-    visits = visits.order_by(Visits.id.desc()).all()
+    # Select one page of results
+    visits, next_cursor = next_page((await db.execute(paginate(visits, Visits.id, limit, cursor, rank))).all(), limit)
 
     if not visits:
         raise HTTPException(status_code=404, detail=f"No visits found matching the provided parameters.")
     
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
     # Convert timezones to Pacific (they are stored as UTC)
-    for visit in visits:
-        visit.date = visit.date.astimezone(pacific).strftime("%m-%d-%Y %I:%M%p %Z")
+    if not fields or "date" in fields:
+        for visit in visits:
+            visit["date"] = visit["date"].astimezone(pacific()).strftime("%m-%d-%Y %I:%M%p %Z")
+
+    return json_response(visits, response)
 
-    return visits
+# GET (Stats)
+# Visit counts per relation, per day and for the top visitors, from the rollup table
+@router.get("/visits/stats", response_model=VisitStatsResponse, tags=["Visits"])
+async def get_visit_stats(
+    request: Request,
+    response: Response,
+    top: int = Query(default=10, ge=1, le=100, description="(optional) Number of top visitors to include (1-100)"),
+    db: AsyncSession = Depends(get_read_db)):
+
+    # Answer 304 Not Modified if the client's copy is still current
+    unchanged = not_modified(request, response, "visits", await get_version(db, "visits"))
+    if unchanged:
+        return unchanged
+
+    return json_response(await get_stats(db, top), response)
+
+# GET (Export)
+# Streams every matching visit, oldest first, without loading the table into memory
+# Dates are ISO 8601, in UTC
+@router.get("/visits/export", tags=["Visits"], response_class=StreamingResponse, responses={200: {"content": {media_type: {} for media_type in EXPORT_FORMATS.values()}}})
+async def export_visits(
+    format: Literal["ndjson", "csv"] = Query(default="ndjson", description="Export format"),
+    start: datetime | None = Query(default=None, description="(optional) Only visits on or after this date/time (ISO 8601, UTC unless an offset is given)"),
+    end: datetime | None = Query(default=None, description="(optional) Only visits before this date/time (ISO 8601, UTC unless an offset is given)"),
+    relation: str | None = Query(default=None, description="(optional) Filter by relation"),
+    key: str = Depends(header_scheme)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    visits = select(*response_columns(Visits, VisitResponse))
+
+    if start:
+        visits = visits.filter(Visits.date >= (start if start.tzinfo else start.replace(tzinfo=timezone.utc)))
+    if end:
+        visits = visits.filter(Visits.date < (end if end.tzinfo else end.replace(tzinfo=timezone.utc)))
+    if relation:
+        visits = visits.filter(Visits.relation.ilike(f"%{relation}%"))
+
+    return stream_export(visits.order_by(Visits.id), format, "visits")
 
 # PUT
 @router.put("/visits/{id}", response_model=VisitResponse, tags=["Visits"])
-def update_visit(
+async def update_visit(
     id: int, # Update by ID
     visit_update: VisitUpdate,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find specified visit
-    visit = db.query(Visits).filter(Visits.id == id).first()
+    # Find specified visit, locked until the update commits
+    # The content hash and the stats depend on its current values, so this one can't be folded into the update
+    old_visit = (await db.execute(select(Visits.name, Visits.relation, Visits.message, Visits.date).filter(Visits.id == id).with_for_update())).first()
 
-    if not visit:
+    if not old_visit:
         raise HTTPException(status_code=404, detail=f"Visit with id {id} not found.")
-    
-    # Update visit
-    if visit_update.name:
-        visit.name = visit_update.name
-    if visit_update.relation:
-        visit.relation = visit_update.relation
-    if visit_update.message:
-        visit.message = visit_update.message
-    
+
+    # Replace only the fields included in the update, and hash the result
+    values = update_values(visit_update)
+    updated = {"name": old_visit.name, "relation": old_visit.relation, "message": old_visit.message, **values}
+    values["content_hash"] = visit_content_hash(updated["name"], updated["relation"], updated["message"])
+
+    try:
+        visit = await update_returning(db, Visits, Visits.id == id, values)
+    except IntegrityError:
+        # Content hash is unique, so the update would duplicate another visit
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"Could not update. {updated['name']} already has a visit with the message '{updated['message']}'.")
+
+    # Take the visit's old counts out of the stats, and add its new ones
+    stat_deltas = visit_deltas([old_visit], -1)
+    stat_deltas.update(visit_deltas([visit]))
+
     # Commit changes to db
-    db.commit()
-    db.refresh(visit)
+    await apply_deltas(db, stat_deltas)
+    await bump_version(db, "visits")
+    await db.commit()
 
     # Convert to formatted string for response
-    visit.date = visit.date.astimezone(pacific).strftime("%m-%d-%Y %I:%M%p %Z")
+    visit.date = visit.date.astimezone(pacific()).strftime("%m-%d-%Y %I:%M%p %Z")
 
     return visit
 
 # DELETE
 @router.delete("/visits/{id}", response_model=VisitResponse, tags=["Visits"])
-def delete_visit(
+async def delete_visit(
     id: int, # Delete by ID,
     key: str = Depends(header_scheme),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_write_db)):
 
     if key != api_key:
         raise HTTPException(status_code=401, detail="Unauthorized API key.")
     
-    # Find specified visit
-    visit = db.query(Visits).filter(Visits.id == id).first()
+    # Delete specified visit in one statement, returning it to take its counts out of the stats
+    visit = await delete_returning(db, Visits, Visits.id == id)
 
     if not visit:
         raise HTTPException(status_code=404, detail=f"Visit with id {id} not found.")
-    
-    # Delete visit
-    db.delete(visit)
-    db.commit()
+
+    await apply_deltas(db, visit_deltas([visit], -1))
+    await bump_version(db, "visits")
+    await db.commit()
 
     # Convert to formatted string for response
-    visit.date = visit.date.astimezone(pacific).strftime("%m-%d-%Y %I:%M%p %Z")
+    visit.date = visit.date.astimezone(pacific()).strftime("%m-%d-%Y %I:%M%p %Z")
+
+    return visit
+
+# Content hash of a visit after an update, for batch_update
+def with_content_hash(visit, values: dict) -> dict:
+    updated = {"name": visit.name, "relation": visit.relation, "message": visit.message, **values}
+    return {**values, "content_hash": visit_content_hash(updated["name"], updated["relation"], updated["message"])}
+
+# PATCH (Batch)
+# Update many visits by ID in one transaction, reporting updated/not_found/conflict (duplicate visit) for each
+@router.patch("/visits/batch", response_model=list[BatchItemResult], tags=["Visits"])
+async def update_visits_batch(
+    visits: list[VisitBatchUpdate] = Body(min_length=1, max_length=BULK_MAX_ITEMS),
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    try:
+        results, updated = await batch_update(db, Visits, visits, "id", ["content_hash"], with_content_hash)
+    except IntegrityError:
+        # Conflicts are checked first, so this is a concurrent write of the same visit
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Could not update. The visits changed during the update, please try again.")
+
+    # Take the old counts out of the stats, and add the new ones
+    stat_deltas = visit_deltas([old for old, new in updated], -1)
+    stat_deltas.update(visit_deltas([new for old, new in updated]))
+
+    await apply_deltas(db, stat_deltas)
+    await bump_version(db, "visits")
+    await db.commit()
+
+    return results
+
+# DELETE (Batch)
+# Delete many visits by ID in one statement (e.g. to clear out spam), reporting deleted/not_found for each
+@router.delete("/visits", response_model=list[BatchItemResult], tags=["Visits"])
+async def delete_visits_batch(
+    ids: str = ids_query,
+    key: str = Depends(header_scheme),
+    db: AsyncSession = Depends(get_write_db)):
+
+    if key != api_key:
+        raise HTTPException(status_code=401, detail="Unauthorized API key.")
+
+    results, deleted = await batch_delete(db, Visits, parse_keys(ids))
+
+    await apply_deltas(db, visit_deltas(deleted, -1))
+    await bump_version(db, "visits")
+    await db.commit()
 
-    return visit
\ No newline at end of file
+    return results
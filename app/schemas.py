@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Literal
 from datetime import datetime
 
 # Structures for API interactions (validation)
@@ -59,6 +59,11 @@ class SkillUpdate(SkillBase):
     category: Optional[str] = None
     name: Optional[str] = None
 
+# PATCH (BATCH)
+# One item of a batch update, identified by ID
+class SkillBatchUpdate(SkillUpdate):
+    id: int
+
 # ================================
 # =          Education           =
 # ================================
@@ -90,6 +95,11 @@ class EducationUpdate(EducationBase):
     dates: Optional[str] = None
     description: Optional[str] = None
 
+# PATCH (BATCH)
+# One item of a batch update, identified by ID
+class EducationBatchUpdate(EducationUpdate):
+    id: int
+
 # ================================
 # =          Experience          =
 # ================================
@@ -119,6 +129,11 @@ class ExperienceUpdate(ExperienceBase):
     dates: Optional[str] = None
     description: Optional[str] = None
 
+# PATCH (BATCH)
+# One item of a batch update, identified by ID
+class ExperienceBatchUpdate(ExperienceUpdate):
+    id: int
+
 # ================================
 # =            Visits            =
 # ================================
@@ -147,3 +162,52 @@ class VisitUpdate(VisitBase):
     name: Optional[str] = None
     relation: Optional[str] = None
     message: Optional[str] = None
+
+# PATCH (BATCH)
+# One item of a batch update, identified by ID
+class VisitBatchUpdate(VisitUpdate):
+    id: int
+
+# GET (Stats)
+# Visit counts from the rollup table (see app/visit_stats.py)
+class VisitorCount(BaseModel):
+    name: str
+    visits: int
+
+class VisitStatsResponse(BaseModel):
+    total: int
+    relations: dict[str, int]
+    days: dict[str, int]
+    top_visitors: list[VisitorCount]
+
+# ================================
+# =          Portfolio           =
+# ================================
+
+# GET
+# Every section at once, reusing the response models above
+# Sections that weren't requested are left out
+class PortfolioResponse(BaseModel):
+    profile: Optional[ProfileResponse] = None
+    skills: Optional[list[SkillResponse]] = None
+    education: Optional[list[EducationResponse]] = None
+    experience: Optional[list[ExperienceResponse]] = None
+
+# ================================
+# =             Bulk             =
+# ================================
+
+# Result for one item of a bulk POST, in the same order as the request
+# ID is only included for created items
+class BulkItemResult(BaseModel):
+    index: int
+    status: Literal["created", "conflict"]
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+# Result for one id of a batch PATCH or DELETE, in the same order as the request
+# (the id is the name for profiles)
+class BatchItemResult(BaseModel):
+    id: int | str
+    status: Literal["updated", "deleted", "not_found", "conflict"]
+    detail: Optional[str] = None
@@ -0,0 +1,90 @@
+from sqlalchemy import DDL, event, func, table, column
+from .models import Visits, Education, Experience
+
+# Indexed search for the long text columns, with the same matching as before: a case-insensitive substring
+# of the whole search string (ILIKE '%terms%'), so "dev" still finds "developing"
+# PostgreSQL: pg_trgm GIN index, which ILIKE '%...%' uses directly, ranked with word_similarity
+# SQLite (local testing): FTS5 trigram table kept in sync with triggers, ranked with bm25
+# Trigram indexes need at least 3 characters -- shorter searches still match, by scanning, and aren't ranked
+
+SEARCH_COLUMNS = [
+    Visits.message,
+    Education.description,
+    Experience.description
+]
+
+def _fts_name(search_column) -> str:
+    return f"{search_column.table.name}_fts"
+
+def _postgres_ddl(search_column) -> list[str]:
+    name, col = search_column.table.name, search_column.name
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX IF NOT EXISTS ix_{name}_{col}_trgm ON {name} USING gin ({col} gin_trgm_ops)"
+    ]
+
+def _sqlite_ddl(search_column) -> list[str]:
+    name, col, fts = search_column.table.name, search_column.name, _fts_name(search_column)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({col}, content='{name}', content_rowid='id', tokenize='trigram')",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {name} BEGIN
+            INSERT INTO {fts}(rowid, {col}) VALUES (new.id, new.{col});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {name} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {col}) VALUES ('delete', old.id, old.{col});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {col} ON {name} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {col}) VALUES ('delete', old.id, old.{col});
+            INSERT INTO {fts}(rowid, {col}) VALUES (new.id, new.{col});
+        END""",
+        # Index any rows that existed before the search table did
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+    ]
+
+# Drops the search index (and on SQLite, its triggers), including the stemmed full-text ones these replaced
+def _drop_ddl(search_column, dialect: str) -> list[str]:
+    name, col, fts = search_column.table.name, search_column.name, _fts_name(search_column)
+    if dialect == "postgresql":
+        return [f"DROP INDEX IF EXISTS ix_{name}_{col}_search", f"DROP INDEX IF EXISTS ix_{name}_{col}_trgm"]
+    if dialect == "sqlite":
+        return [f"DROP TRIGGER IF EXISTS {fts}_{action}" for action in ("insert", "delete", "update")] + [f"DROP TABLE IF EXISTS {fts}"]
+    return []
+
+def _ddl(search_column, dialect: str) -> list[str]:
+    if dialect == "postgresql":
+        return _postgres_ddl(search_column)
+    if dialect == "sqlite":
+        return _sqlite_ddl(search_column)
+    return []
+
+# Create the search indexes for tables that already exist, replacing any from before (see app/migrations/search_indexes.py)
+def create_search_indexes(connection):
+    for search_column in SEARCH_COLUMNS:
+        for statement in _drop_ddl(search_column, connection.dialect.name) + _ddl(search_column, connection.dialect.name):
+            connection.exec_driver_sql(statement)
+
+# Create the search indexes alongside their tables in create_all()
+for search_column in SEARCH_COLUMNS:
+    for statement in _postgres_ddl(search_column):
+        event.listen(search_column.table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+    for statement in _sqlite_ddl(search_column):
+        event.listen(search_column.table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    event.listen(search_column.table, "before_drop", DDL(f"DROP TABLE IF EXISTS {_fts_name(search_column)}").execute_if(dialect="sqlite"))
+
+# Filter a query to rows containing terms (case-insensitive)
+# Returns the filtered query and a relevance expression (higher is more relevant) to order by,
+# or None if there is nothing to rank by
+def search(query, model, search_column, terms: str, dialect: str):
+    if len(terms) < 3 or dialect not in ("postgresql", "sqlite"):
+        return query.filter(search_column.ilike(f"%{terms}%")), None
+
+    if dialect == "postgresql":
+        query = query.filter(search_column.ilike(f"%{terms}%"))
+        return query, func.word_similarity(terms, search_column)
+
+    fts = table(_fts_name(search_column), column("rowid"), column("rank"), column(search_column.name))
+    # Quoted as one phrase, which the trigram tokenizer matches as a substring, so FTS5 doesn't parse user input as query syntax
+    match = '"' + terms.replace('"', '""') + '"'
+    query = query.join(fts, fts.c.rowid == model.id).filter(fts.c[search_column.name].op("MATCH")(match))
+    # FTS5 rank is bm25, where lower is more relevant
+    return query, -fts.c.rank
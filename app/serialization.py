@@ -0,0 +1,43 @@
+from fastapi import HTTPException, Query, Response
+import orjson
+
+# Fast response path for the GET endpoints
+# The queries select exactly the columns of the response schema, so their rows already match it.
+# Those trusted dicts skip FastAPI's response_model validation and are encoded straight to bytes with orjson.
+# The routes still declare response_model, so the OpenAPI docs are unchanged.
+
+# Columns to select for a response schema (or just the given fields of it)
+def response_columns(model, schema, fields: tuple[str, ...] | None = None) -> list:
+    return [getattr(model, field) for field in fields or schema.model_fields]
+
+# Sparse fieldsets
+# The list endpoints take fields=a,b to return only some of the response fields, selecting only those columns,
+# so unrequested ones (like long descriptions) are never fetched or encoded. id is always included, since cursors use it.
+# The response_model stays the full schema, which documents every field that can be returned.
+def fields_query(schema):
+    return Query(default=None, description=f"(optional) Comma-separated fields to return, from: {', '.join(schema.model_fields)} (default: all)")
+
+# The requested fields, in schema order, or None for all of them
+def parse_fields(fields: str | None, schema) -> tuple[str, ...] | None:
+    requested = {field.strip() for field in fields.split(",") if field.strip()} if fields else set()
+    if not requested:
+        return None
+
+    unknown = requested - schema.model_fields.keys()
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}. Choose from: {', '.join(schema.model_fields)}.")
+
+    if "id" in schema.model_fields:
+        requested.add("id")
+    return tuple(field for field in schema.model_fields if field in requested)
+
+# Only the given fields of rows that were loaded in full (e.g. from the snapshot)
+def select_fields(rows: list[dict], fields: tuple[str, ...] | None) -> list[dict]:
+    if not fields:
+        return rows
+    return [{field: row[field] for field in fields} for row in rows]
+
+# Encode trusted content, keeping any headers already set on the endpoint's injected response
+def json_response(content, response: Response | None = None, status_code: int = 200) -> Response:
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"} if response else None
+    return Response(content=orjson.dumps(content), status_code=status_code, headers=headers, media_type="application/json")
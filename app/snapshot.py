@@ -0,0 +1,210 @@
+from sqlalchemy import select
+from datetime import datetime, timezone
+import argparse
+import contextlib
+import logging
+import orjson
+import os
+
+from .models import Profile, Skills, Education, Experience, TableVersion
+from .schemas import ProfileResponse, SkillResponse, EducationResponse, ExperienceResponse
+from .serialization import response_columns
+from .pagination import encode_cursor, decode_cursor
+
+# fcntl is Unix-only -- elsewhere, refreshes from different workers aren't serialized
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Static snapshot of the catalog tables (profile, skills, education, experience)
+# `python -m app.snapshot` exports them to a JSON file at deploy time.
+# With SNAPSHOT_MODE=true, the GET endpoints for those tables answer from the snapshot in memory,
+# so reads keep working (without waiting) while Neon's compute is suspended.
+# Writes still go to the database, and then regenerate their table in the snapshot and the file.
+# Other workers on the same machine pick up the new file the next time they serve a request.
+# Each refresh rereads the file under a lock before replacing its table, so workers don't overwrite each other's tables.
+# Filters are applied in Python: description search matches the same case-insensitive substrings as the database,
+# but ordered by id rather than by relevance.
+
+SNAPSHOT_MODE = os.getenv("SNAPSHOT_MODE", "false").lower() in ("1", "true", "yes")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshot.json")
+
+# Bump when the file layout changes, so an old file is rejected instead of misread
+SNAPSHOT_FORMAT = 1
+
+# Table -> (model, response schema, order of the rows in the snapshot)
+TABLES = {
+    "profile": (Profile, ProfileResponse, [Profile.id]),
+    "skills": (Skills, SkillResponse, [Skills.category, Skills.name]),
+    "education": (Education, EducationResponse, [Education.id.desc()]),
+    "experience": (Experience, ExperienceResponse, [Experience.id.desc()])
+}
+
+logger = logging.getLogger(__name__)
+
+def table_query(table: str):
+    model, schema, order = TABLES[table]
+    return select(*response_columns(model, schema)).order_by(*order)
+
+def versions_query(tables):
+    return select(TableVersion.name, TableVersion.version, TableVersion.updated_at).filter(TableVersion.name.in_(tables))
+
+def version_entry(version: int, updated_at: datetime | None) -> dict:
+    # SQLite doesn't store timezones
+    if updated_at and updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return {"version": version, "updated_at": updated_at.isoformat() if updated_at else None}
+
+def write_file(content: dict, path: str):
+    # Write to a temporary file first, so readers never see half a snapshot
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(orjson.dumps(content))
+    os.replace(temporary, path)
+
+class Snapshot:
+    def __init__(self, path: str):
+        self.path = path
+        self.content = None
+        self.modified = None # mtime of the file the content was loaded from (or written to)
+        self.reload()
+
+    def reload(self):
+        try:
+            modified = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            raise RuntimeError(f"SNAPSHOT_MODE is on, but {self.path} doesn't exist -- create it with `python -m app.snapshot`")
+
+        if modified == self.modified:
+            return
+
+        with open(self.path, "rb") as file:
+            content = orjson.loads(file.read())
+        if content.get("format") != SNAPSHOT_FORMAT:
+            raise RuntimeError(f"{self.path} is snapshot format {content.get('format')}, expected {SNAPSHOT_FORMAT} -- export it again")
+
+        self.content, self.modified = content, modified
+
+    def rows(self, table: str) -> list[dict]:
+        self.reload()
+        return self.content["tables"][table]
+
+    # Same shape as versions.get_version()
+    def version(self, table: str) -> tuple[int, datetime | None]:
+        self.reload()
+        entry = self.content["versions"].get(table)
+        if not entry:
+            return 0, None
+        updated_at = entry["updated_at"]
+        return entry["version"], datetime.fromisoformat(updated_at) if updated_at else None
+
+    # Exclusive lock on a file next to the snapshot, held while one worker rereads, changes and replaces it
+    @contextlib.contextmanager
+    def lock(self):
+        if not fcntl:
+            yield
+            return
+        try:
+            file = open(f"{self.path}.lock", "a")
+        except OSError:
+            # Read-only directory -- the snapshot itself can't be written either
+            yield
+            return
+        with file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    # Regenerate one table (after a committed write) from the database
+    async def refresh(self, db, table: str):
+        rows = (await db.execute(table_query(table))).mappings().all()
+        version = (await db.execute(versions_query([table]))).first()
+        version = version_entry(version.version, version.updated_at) if version else None
+
+        # No awaits while the lock is held, so other requests in this worker can't wait on it
+        with self.lock():
+            # Start from the latest file, which may have other workers' changes
+            self.reload()
+
+            # Another worker may already have written a newer version of this table
+            current = self.content["versions"].get(table)
+            if current and version and current["version"] > version["version"]:
+                return
+
+            self.content["tables"][table] = [dict(row) for row in rows]
+            self.content["versions"][table] = version
+            self.content["created_at"] = datetime.now(timezone.utc).isoformat()
+
+            # The file can be read-only (e.g. on Vercel), in which case only this worker's copy is updated
+            try:
+                write_file(self.content, self.path)
+                self.modified = os.stat(self.path).st_mtime_ns
+            except OSError:
+                logger.exception("Failed to write snapshot %s", self.path)
+
+    def profile(self) -> dict | None:
+        rows = self.rows("profile")
+        return rows[0] if rows else None
+
+    # Skills filters are exact, but case-insensitive, like the database query
+    def skills(self, category, name) -> list[dict]:
+        category = category and category.lower()
+        name = name and name.lower()
+        return [
+            skill for skill in self.rows("skills")
+            if (not category or skill["category"].lower() == category) and (not name or skill["name"].lower() == name)
+        ]
+
+    # One page of education or experience
+    # filters maps a column to a case-insensitive substring, and so does description
+    def page(self, table: str, filters: dict, description, limit: int, cursor: str | None) -> tuple[list[dict], str | None]:
+        filters = {column: value.lower() for column, value in {**filters, "description": description}.items() if value}
+        last_id = decode_cursor(cursor)["id"] if cursor else None
+
+        page = []
+        next_cursor = None
+        for row in self.rows(table):
+            if last_id is not None and row["id"] >= last_id:
+                continue
+            if any(value not in row[column].lower() for column, value in filters.items()):
+                continue
+            if len(page) == limit:
+                next_cursor = encode_cursor(page[-1]["id"])
+                break
+            page.append(row)
+
+        return page, next_cursor
+
+snapshot = Snapshot(SNAPSHOT_PATH) if SNAPSHOT_MODE else None
+
+# Regenerate a table in the snapshot after a committed write (does nothing unless SNAPSHOT_MODE is on)
+async def refresh_snapshot(db, table: str):
+    if snapshot:
+        await snapshot.refresh(db, table)
+
+# Export every catalog table to a snapshot file
+def export(connection, path: str) -> dict:
+    versions = {row.name: version_entry(row.version, row.updated_at) for row in connection.execute(versions_query(list(TABLES)))}
+    content = {
+        "format": SNAPSHOT_FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "versions": {table: versions.get(table) for table in TABLES},
+        "tables": {table: [dict(row) for row in connection.execute(table_query(table)).mappings()] for table in TABLES}
+    }
+    write_file(content, path)
+    return content
+
+if __name__ == "__main__":
+    from .database import get_engine
+
+    parser = argparse.ArgumentParser(description="Export the catalog tables to a snapshot file")
+    parser.add_argument("--output", default=SNAPSHOT_PATH, help=f"(default: {SNAPSHOT_PATH})")
+    args = parser.parse_args()
+
+    with get_engine().connect() as connection:
+        content = export(connection, args.output)
+
+    print(f"Wrote {args.output}: " + ", ".join(f"{len(rows)} {table}" for table, rows in content["tables"].items()))
@@ -0,0 +1,95 @@
+from fastapi import Request, Response
+from sqlalchemy import select
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import datetime, timezone
+import hashlib
+
+from .database import dialect_insert
+from .models import TableVersion
+from .snapshot import snapshot, TABLES as SNAPSHOT_TABLES
+
+# Conditional GETs
+# Every write bumps its table's version (in the same transaction), and the GET endpoints send
+# an ETag built from that version plus the query string, along with Last-Modified.
+# When a client sends back If-None-Match (or If-Modified-Since) and the table hasn't changed since,
+# we answer 304 Not Modified before running the actual query.
+
+# Bump a table's version -- call before committing a write
+async def bump_version(db, table: str):
+    now = datetime.now(timezone.utc)
+    statement = dialect_insert(db, TableVersion).values(name=table, version=1, updated_at=now)
+    statement = statement.on_conflict_do_update(
+        index_elements=[TableVersion.name],
+        set_={"version": TableVersion.version + 1, "updated_at": now})
+
+    await db.execute(statement)
+
+# Current (version, last modified) of a table
+# Tables that have never been written to since versions were added start at version 0
+# If a cache is given, the version is cached with the table's pages and invalidated along with them
+async def get_version(db, table: str, cache=None) -> tuple[int, datetime | None]:
+    # Snapshot mode keeps the catalog versions with the data, so they match what is served
+    if snapshot and table in SNAPSHOT_TABLES:
+        return snapshot.version(table)
+
+    if cache:
+        cache_key = cache.key(table, table_version=True)
+        version = cache.get(cache_key)
+        if version is None:
+            version = await get_version(db, table)
+            cache.set(cache_key, version)
+        return version
+
+    row = (await db.execute(select(TableVersion.version, TableVersion.updated_at).filter(TableVersion.name == table))).first()
+
+    if not row:
+        return 0, None
+
+    version, updated_at = row
+    # SQLite doesn't store timezones
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return version, updated_at
+
+def _etag(request: Request, table: str, version: int) -> str:
+    # Different query strings return different bodies, so they need different tags
+    query = hashlib.sha1(str(request.url.query).encode()).hexdigest()[:12]
+    return f'W/"{table}-{version}-{query}"'
+
+def _matches(request: Request, etag: str, updated_at: datetime | None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+
+    # If-None-Match takes precedence over If-Modified-Since
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+
+    if if_modified_since and updated_at:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates only have second precision
+        return since.tzinfo is not None and updated_at.replace(microsecond=0) <= since
+
+    return False
+
+# Set the caching headers on the response
+# Returns a 304 response to send instead if the client's copy is still current, otherwise None
+def not_modified(request: Request, response: Response, table: str, version: tuple[int, datetime | None]) -> Response | None:
+    number, updated_at = version
+    headers = {
+        "ETag": _etag(request, table, number),
+        # Clients may keep a copy, but must check it's current before using it
+        "Cache-Control": "no-cache"
+    }
+    if updated_at:
+        headers["Last-Modified"] = format_datetime(updated_at, usegmt=True)
+
+    if _matches(request, headers["ETag"], updated_at):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
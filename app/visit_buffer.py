@@ -0,0 +1,126 @@
+from contextlib import suppress
+import asyncio
+import logging
+import os
+
+from .database import AsyncSessionLocal, dialect_insert
+from .models import Visits
+from .versions import bump_version
+from .visit_stats import visit_deltas, apply_deltas
+
+# Optional write-behind mode for POST /visits (VISITS_WRITE_BEHIND=true)
+# Validated visits are queued in memory and answered with 202 Accepted straight away.
+# A background task writes them in batches -- one multi-row INSERT and one commit per batch --
+# once VISITS_BATCH_SIZE visits are waiting, or VISITS_FLUSH_INTERVAL seconds after the first one arrived.
+# At most VISITS_QUEUE_SIZE visits wait at once (queued or collected into the next batch); past that, POST /visits answers 503 with Retry-After.
+# A batch that fails to write (e.g. the database is briefly unreachable) is retried up to VISITS_FLUSH_RETRIES times,
+# waiting VISITS_RETRY_DELAY seconds and doubling each time; it's only dropped (and logged) once every retry has failed.
+# While a batch is being retried, new visits keep queuing up to VISITS_QUEUE_SIZE.
+# Everything still queued is written when the app shuts down.
+# Only use this on a long-running server (Render/Docker) -- a serverless instance can be frozen with visits still queued.
+
+VISITS_WRITE_BEHIND = os.getenv("VISITS_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+VISITS_BATCH_SIZE = int(os.getenv("VISITS_BATCH_SIZE", 100))
+VISITS_FLUSH_INTERVAL = float(os.getenv("VISITS_FLUSH_INTERVAL", 1.0))
+VISITS_QUEUE_SIZE = int(os.getenv("VISITS_QUEUE_SIZE", 1000))
+VISITS_FLUSH_RETRIES = int(os.getenv("VISITS_FLUSH_RETRIES", 4))
+VISITS_RETRY_DELAY = float(os.getenv("VISITS_RETRY_DELAY", 0.5)) # seconds, doubled after each failed attempt
+
+logger = logging.getLogger(__name__)
+
+class VisitBuffer:
+    def __init__(self, batch_size: int, flush_interval: float, max_size: int, retries: int = VISITS_FLUSH_RETRIES, retry_delay: float = VISITS_RETRY_DELAY):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue = None
+        self.batch = [] # Visits taken off the queue, but not yet handed to a flush
+        self.task = None
+        self.flushing = None
+
+    # Start the background writer (the queue belongs to the running event loop, so it's created here)
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.task = asyncio.create_task(self._run())
+
+    # Queue a visit (a dict of Visits columns, including content_hash), returns False if the queue is full
+    # Visits already moved into the batch still count, since they haven't been handed to a flush yet
+    def enqueue(self, visit: dict) -> bool:
+        if self.queue.qsize() + len(self.batch) >= self.max_size:
+            return False
+        try:
+            self.queue.put_nowait(visit)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # Wait for the first visit, then collect more until the batch is full or the window closes
+            self.batch.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+
+            while len(self.batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self.batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except TimeoutError:
+                    break
+
+            batch, self.batch = self.batch, []
+
+            # Shielded, so shutting down never interrupts a batch halfway through
+            self.flushing = asyncio.create_task(self._flush(batch))
+            await asyncio.shield(self.flushing)
+
+    async def _flush(self, batch: list[dict]):
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                await self._write(batch)
+                return
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception("Failed to write %d queued visits after %d attempts, dropping them", len(batch), attempt + 1)
+                    return
+                logger.warning("Failed to write %d queued visits, retrying in %.1fs", len(batch), delay, exc_info=True)
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def _write(self, batch: list[dict]):
+        async with AsyncSessionLocal() as db:
+            # Duplicates (by content hash) are skipped rather than failing the whole batch
+            statement = dialect_insert(db, Visits).values(batch).on_conflict_do_nothing(index_elements=[Visits.content_hash])
+            inserted = (await db.execute(statement.returning(Visits.name, Visits.relation, Visits.date))).all()
+            await apply_deltas(db, visit_deltas(inserted))
+            await bump_version(db, "visits")
+            await db.commit()
+
+    # Stop the background writer and write everything still queued
+    async def stop(self):
+        if self.task is None:
+            return
+
+        self.task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self.task
+        if self.flushing:
+            await self.flushing
+
+        remaining = self.batch
+        while not self.queue.empty():
+            remaining.append(self.queue.get_nowait())
+
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[start:start + self.batch_size])
+
+        self.batch = []
+        self.task = None
+
+visit_buffer = VisitBuffer(VISITS_BATCH_SIZE, VISITS_FLUSH_INTERVAL, VISITS_QUEUE_SIZE) if VISITS_WRITE_BEHIND else None
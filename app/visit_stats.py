@@ -0,0 +1,118 @@
+from sqlalchemy import select, delete
+from collections import Counter
+from datetime import timezone
+from functools import cache
+import argparse
+
+from .database import dialect_insert
+from .models import Visits, VisitStat
+
+# Visit analytics rollup
+# visit_stats holds a count per relation, per day (Pacific time) and per visitor, so GET /visits/stats reads
+# a few small rows instead of grouping the whole visits table. Every visit write applies its change to the
+# counts in the same transaction: +1 for a new visit, -1 for a deleted one, and both for an update.
+# python -m app.visit_stats rebuild  -- recompute the counts from the visits table (e.g. after adding the table)
+# python -m app.visit_stats check    -- compare the counts with the visits table, exits with status 1 if they differ
+
+# pytz is only needed once visits are read or counted, so it's imported then instead of at startup
+@cache
+def pacific():
+    from pytz import timezone
+    return timezone("America/Los_Angeles")
+
+# Relations and names are counted case- and whitespace-insensitively
+def normalize(value: str) -> str:
+    return " ".join(value.split()).lower()
+
+def stat_keys(name: str, relation: str, date) -> list[tuple[str, str]]:
+    # SQLite doesn't store timezones
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return [
+        ("relation", normalize(relation)),
+        ("day", date.astimezone(pacific()).date().isoformat()),
+        ("visitor", normalize(name))
+    ]
+
+# Count changes for visits being added (sign=1) or removed (sign=-1)
+def visit_deltas(visits, sign: int = 1) -> Counter:
+    deltas = Counter()
+    for visit in visits:
+        for stat in stat_keys(visit.name, visit.relation, visit.date):
+            deltas[stat] += sign
+    return deltas
+
+# Apply count changes in one upsert -- call before committing the visit write
+async def apply_deltas(db, deltas: Counter):
+    deltas = {stat: delta for stat, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    statement = dialect_insert(db, VisitStat).values([{"kind": kind, "key": key, "count": delta} for (kind, key), delta in deltas.items()])
+    statement = statement.on_conflict_do_update(
+        index_elements=[VisitStat.kind, VisitStat.key],
+        set_={"count": VisitStat.count + statement.excluded.count})
+    await db.execute(statement)
+
+    # Keys with no visits left are removed, like a rebuild would leave them
+    if any(delta < 0 for delta in deltas.values()):
+        await db.execute(delete(VisitStat).filter(VisitStat.count <= 0))
+
+async def get_stats(db, top: int) -> dict:
+    rows = (await db.execute(select(VisitStat.kind, VisitStat.key, VisitStat.count).filter(VisitStat.kind != "visitor"))).all()
+    visitors = (await db.execute(
+        select(VisitStat.key, VisitStat.count)
+        .filter(VisitStat.kind == "visitor")
+        .order_by(VisitStat.count.desc(), VisitStat.key)
+        .limit(top))).all()
+
+    relations = {key: count for kind, key, count in sorted(rows, key=lambda row: -row.count) if kind == "relation"}
+    return {
+        "total": sum(relations.values()),
+        "relations": relations,
+        "days": {key: count for kind, key, count in sorted(rows, key=lambda row: row.key) if kind == "day"},
+        "top_visitors": [{"name": key, "visits": count} for key, count in visitors]
+    }
+
+# Counts computed from scratch, reading the visits table in batches
+def count_visits(connection) -> Counter:
+    counts = Counter()
+    for partition in connection.execute(select(Visits.name, Visits.relation, Visits.date).execution_options(yield_per=1000)).partitions():
+        counts.update(visit_deltas(partition))
+    return counts
+
+def stored_counts(connection) -> Counter:
+    return Counter({(kind, key): count for kind, key, count in connection.execute(select(VisitStat.kind, VisitStat.key, VisitStat.count))})
+
+def rebuild(connection) -> Counter:
+    counts = count_visits(connection)
+    connection.execute(delete(VisitStat))
+    if counts:
+        connection.execute(VisitStat.__table__.insert(), [{"kind": kind, "key": key, "count": count} for (kind, key), count in counts.items()])
+    return counts
+
+# Differences between the rollup and the visits table, as {(kind, key): (stored, actual)}
+def check(connection) -> dict:
+    stored, actual = stored_counts(connection), count_visits(connection)
+    return {stat: (stored[stat], actual[stat]) for stat in stored.keys() | actual.keys() if stored[stat] != actual[stat]}
+
+if __name__ == "__main__":
+    from .database import get_engine
+
+    parser = argparse.ArgumentParser(description="Rebuild or check the visit_stats rollup")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        VisitStat.__table__.create(get_engine(), checkfirst=True)
+        with get_engine().begin() as connection:
+            counts = rebuild(connection)
+        print(f"Rebuilt visit_stats: {len(counts)} rows")
+    else:
+        with get_engine().connect() as connection:
+            differences = check(connection)
+        for (kind, key), (stored, actual) in sorted(differences.items()):
+            print(f"{kind} {key!r}: rollup has {stored}, visits table has {actual}")
+        print("visit_stats is consistent" if not differences else f"{len(differences)} differences")
+        if differences:
+            raise SystemExit(1)
@@ -0,0 +1,70 @@
+from sqlalchemy import create_engine
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Measures a cold start the way a serverless instance sees it: a fresh interpreter imports app.main,
+# runs the lifespan hook, and answers its first request (GET /skills) shortly after.
+# Each run is a new process, so nothing is cached between runs, and the median of the runs is reported.
+# Uses a local SQLite file as a stand-in for Neon, so the connection itself is much cheaper than in production.
+# python -m benchmarks.cold_start --runs 10
+
+# Runs inside each fresh process, and prints its timings as JSON
+CHILD = """
+import time
+start = time.perf_counter()
+
+from app.main import app
+imported = time.perf_counter()
+
+import asyncio, httpx, json, os
+
+async def first_request():
+    async with app.router.lifespan_context(app):
+        # Time between the server starting and the first request reaching it
+        await asyncio.sleep(int(os.environ["BENCH_DELAY_MS"]) / 1000)
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/skills")
+            response.raise_for_status()
+        return started, time.perf_counter()
+
+started, responded = asyncio.run(first_request())
+print(json.dumps({"import": imported - start, "first_response": responded - started}))
+"""
+
+def measure(path: str, prewarm: bool, delay_ms: int) -> dict:
+    env = dict(os.environ, NEON_DB_URL=f"sqlite:///{path}", DB_PREWARM=str(prewarm).lower(), BENCH_DELAY_MS=str(delay_ms))
+    output = subprocess.run([sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and time-to-first-response of a fresh process")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--delay-ms", type=int, default=50, help="Wait between startup and the first request (not included in the times)")
+    args = parser.parse_args()
+
+    from app.database import Base
+    from app.models import Skills
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(seed)
+        with seed.begin() as connection:
+            connection.execute(Skills.__table__.insert(), [{"category": "Languages", "name": f"Skill {i}"} for i in range(20)])
+        seed.dispose()
+
+        print(f"{args.runs} fresh processes each, median times")
+        for prewarm in (False, True):
+            runs = [measure(path, prewarm, args.delay_ms) for _ in range(args.runs)]
+            timings = {name: statistics.median(run[name] for run in runs) * 1000 for name in runs[0]}
+            print(f"  DB_PREWARM={str(prewarm).lower():<5}  " + "  ".join(f"{name}: {value:.1f}ms" for name, value in timings.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+from fastapi import FastAPI, Response
+import argparse
+import asyncio
+import time
+
+from app.compression import CompressionMiddleware, CompressionCache, COMPRESSION_CACHE_BYTES, available_encodings
+from app.serialization import json_response
+
+# Bytes on the wire and CPU time per request for a large list response, before and after compression
+#   identity:     no compression (the old behaviour, and clients that don't send Accept-Encoding)
+#   <enc> cold:   compressed on every request (cache turned off)
+#   <enc> cached: the same body requested again, served from the precompressed cache
+# The rows look like GET /visits pages, with long messages. No database is involved.
+# python -m benchmarks.compression --rows 10 100 1000 --requests 200
+
+def build_rows(count: int) -> list[dict]:
+    return [
+        {
+            "name": f"Visitor {i}", "relation": ["Friend", "Family", "Recruiter"][i % 3],
+            "message": f"Visitor {i} here -- I really enjoyed looking through your projects, especially the portfolio API. " * 3,
+            "id": i, "date": "05-30-2025 10:15AM PDT"
+        }
+        for i in range(count)
+    ]
+
+def build_app(rows: list[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/visits")
+    async def get_visits(response: Response):
+        return json_response(rows, response)
+
+    return app
+
+async def request(app, encoding: str) -> int:
+    # Call the ASGI app directly, so client-side decompression isn't counted
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/visits", "raw_path": b"/visits", "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"accept-encoding", encoding.encode())], "client": ("127.0.0.1", 1), "server": ("bench", 80)
+    }
+    size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return size
+
+async def measure(app, encoding: str, requests: int) -> tuple[int, float]:
+    size = await request(app, encoding) # Warm up (and fill the cache, when there is one)
+    start = time.process_time()
+    for _ in range(requests):
+        await request(app, encoding)
+    return size, (time.process_time() - start) / requests
+
+def main():
+    parser = argparse.ArgumentParser(description="Response compression: bytes on the wire and CPU per request")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per measurement (the average is reported)")
+    args = parser.parse_args()
+
+    for count in args.rows:
+        app = build_app(build_rows(count))
+        cases = {"identity": (app, "identity")}
+        for encoding in available_encodings():
+            cases[f"{encoding} cold"] = (CompressionMiddleware(app, cache=CompressionCache(0)), encoding)
+            cases[f"{encoding} cached"] = (CompressionMiddleware(app, cache=CompressionCache(COMPRESSION_CACHE_BYTES)), encoding)
+
+        results = {name: asyncio.run(measure(wrapped, encoding, args.requests)) for name, (wrapped, encoding) in cases.items()}
+        identity_size = results["identity"][0]
+
+        print(f"{count} rows")
+        for name, (size, seconds) in results.items():
+            print(f"  {name:>12}: {size / 1024:8.1f} KiB ({size / identity_size:5.1%})  {seconds * 1_000_000:8.0f}us CPU/request")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from fastapi import FastAPI, Depends
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+import argparse
+import asyncio
+import httpx
+import os
+import tempfile
+import time
+
+from app.database import Base
+from app.models import Skills
+
+# Compares concurrent throughput of sync handlers (threadpool + Session) against async handlers (AsyncSession)
+# Uses a local SQLite file as a stand-in for Neon, with a sleep_ms() function to simulate the network round trip
+# The client runs in the same process, so CPU caps both modes at the same rate when latency is low.
+# Sync handlers are also capped at (threadpool size / latency) -- 40 threads by default -- which async handlers are not.
+# python -m benchmarks.db_modes --requests 2000 --concurrency 200 --latency-ms 150
+
+def add_latency(engine):
+    @event.listens_for(engine, "connect")
+    def register(dbapi_connection, connection_record):
+        # aiosqlite runs each connection in its own thread, so the sleep blocks that thread -- like a socket wait would
+        raw = getattr(dbapi_connection, "_connection", None)
+        sqlite_connection = raw._conn if raw is not None else dbapi_connection
+        sqlite_connection.create_function("sleep_ms", 1, lambda ms: time.sleep(ms / 1000))
+
+def build_sync_app(path: str, latency_ms: int, pool_size: int) -> FastAPI:
+    engine = create_engine(f"sqlite:///{path}", pool_size=pool_size, max_overflow=0)
+    add_latency(engine)
+    SessionLocal = sessionmaker(bind=engine)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+
+    @app.get("/skills")
+    def get_skills(db = Depends(get_db)):
+        db.execute(text("SELECT sleep_ms(:ms)"), {"ms": latency_ms})
+        return [{"id": skill.id, "name": skill.name} for skill in db.scalars(select(Skills))]
+
+    return app
+
+def build_async_app(path: str, latency_ms: int, pool_size: int) -> FastAPI:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=pool_size, max_overflow=0)
+    add_latency(engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+
+    @app.get("/skills")
+    async def get_skills(db = Depends(get_db)):
+        await db.execute(text("SELECT sleep_ms(:ms)"), {"ms": latency_ms})
+        return [{"id": skill.id, "name": skill.name} for skill in await db.scalars(select(Skills))]
+
+    return app
+
+async def run(app: FastAPI, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                response = await client.get("/skills")
+                response.raise_for_status()
+
+        # Warm up the pool
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async database throughput")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency-ms", type=int, default=150, help="Simulated database round trip")
+    parser.add_argument("--pool-size", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(seed, tables=[Skills.__table__])
+        with seed.begin() as connection:
+            connection.execute(Skills.__table__.insert(), [{"category": "Languages", "name": f"Skill {i}"} for i in range(20)])
+        seed.dispose()
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}, {args.latency_ms}ms simulated latency, pool size {args.pool_size}")
+        for mode, build in [("sync", build_sync_app), ("async", build_async_app)]:
+            app = build(path, args.latency_ms, args.pool_size)
+            elapsed = asyncio.run(run(app, args.requests, args.concurrency))
+            print(f"{mode:>5}: {elapsed:.2f}s, {args.requests / elapsed:.0f} req/s")
+
+if __name__ == "__main__":
+    main()
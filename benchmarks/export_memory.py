@@ -0,0 +1,113 @@
+from sqlalchemy import create_engine
+from datetime import datetime, timedelta, timezone
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Checks that GET /visits/export streams: peak Python memory (tracemalloc) while exporting
+# should stay the same whether the table has thousands or millions of rows.
+# The rows are generated into a local SQLite database, which grows to each size in turn,
+# and the response body is counted and discarded as it arrives.
+# Exits with status 1 if the peak at the largest size is more than --max-growth times the peak at the smallest.
+# python -m benchmarks.export_memory --rows 10000 100000 1000000
+
+API_KEY = "benchmark"
+
+# Add visits number first to count - 1
+def seed(engine, first: int, count: int):
+    from app.models import Visits
+
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as connection:
+        for offset in range(first, count, 10000):
+            connection.execute(Visits.__table__.insert(), [
+                {"name": f"Visitor {i}", "relation": "Friend", "message": f"Hello from visitor {i}!", "date": start + timedelta(minutes=i), "content_hash": f"{i:064x}"}
+                for i in range(offset, min(offset + 10000, count))
+            ])
+
+async def export(app, format: str) -> int:
+    # Drive the ASGI app directly -- test clients buffer the whole body, which would defeat the measurement
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/visits/export", "raw_path": b"/visits/export", "query_string": f"format={format}".encode(),
+        "headers": [(b"host", b"bench"), (b"api_key", API_KEY.encode())], "client": ("127.0.0.1", 1), "server": ("bench", 80)
+    }
+    received = 0
+    status = None
+
+    # ASGI spec 2.4 lets the response stream without also listening for a disconnect
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal received, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    if status != 200:
+        raise SystemExit(f"Export failed with status {status}")
+    return received
+
+async def measure(app, format: str) -> tuple[int, int, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = await export(app, format)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak, elapsed
+
+async def run(engine, counts: list[int], format: str) -> list[int]:
+    from app.main import app
+
+    # Warm up, so one-off imports and caches aren't counted against the first size
+    await export(app, format)
+
+    peaks = []
+    seeded = 0
+    for count in counts:
+        seed(engine, seeded, count)
+        seeded = count
+
+        size, peak, elapsed = await measure(app, format)
+        peaks.append(peak)
+        print(f"{count:>9} rows: {size / 1024 / 1024:8.1f} MiB exported in {elapsed:6.2f}s, peak traced memory {peak / 1024 / 1024:6.2f} MiB")
+
+    return peaks
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of the streaming visits export")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--max-growth", type=float, default=2.0)
+    args = parser.parse_args()
+
+    counts = sorted(args.rows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Settings are read when the app is imported, so they are set first
+        os.environ["NEON_DB_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        os.environ["API_KEY"] = API_KEY
+
+        from app.database import Base
+        from app.models import Visits
+
+        engine = create_engine(os.environ["NEON_DB_URL"])
+        Base.metadata.create_all(engine, tables=[Visits.__table__])
+        peaks = asyncio.run(run(engine, counts, args.format))
+        engine.dispose()
+
+    growth = peaks[-1] / peaks[0]
+    print(f"Peak memory grew {growth:.2f}x from {counts[0]} to {counts[-1]} rows (limit {args.max_growth}x)")
+    if growth > args.max_growth:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
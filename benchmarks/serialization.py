@@ -0,0 +1,71 @@
+from fastapi import FastAPI, Response
+from types import SimpleNamespace
+import argparse
+import asyncio
+import httpx
+import time
+
+from app.schemas import VisitResponse
+from app.serialization import json_response
+
+# Compares the cost of turning rows into a JSON response body
+#   response_model: ORM-style objects returned as they are, validated against the response schema and encoded by FastAPI (the old GET path)
+#   json_response:  dicts from a column select, encoded straight to bytes with orjson (the current GET path)
+# No database is involved, so the difference is all serialization.
+# python -m benchmarks.serialization --rows 1000 10000 100000 --repeat 5
+
+def build_rows(count: int) -> list[dict]:
+    return [
+        {"name": f"Visitor {i}", "relation": "Friend", "message": f"Message number {i}, " * 4, "id": i, "date": "05-30-2025 10:15AM PDT"}
+        for i in range(count)
+    ]
+
+def build_app(rows: list[dict]) -> FastAPI:
+    objects = [SimpleNamespace(**row) for row in rows]
+    app = FastAPI()
+
+    @app.get("/response_model", response_model=list[VisitResponse])
+    async def with_response_model():
+        return objects
+
+    @app.get("/json_response", response_model=list[VisitResponse])
+    async def with_json_response(response: Response):
+        return json_response(rows, response)
+
+    return app
+
+async def run(app: FastAPI, path: str, repeat: int) -> tuple[float, int]:
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up
+        (await client.get(path)).raise_for_status()
+
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await client.get(path)
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            best = elapsed if best is None else min(best, elapsed)
+
+        return best, len(response.content)
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization cost")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5, help="Requests per measurement (the fastest is reported)")
+    args = parser.parse_args()
+
+    for count in args.rows:
+        app = build_app(build_rows(count))
+        results = {path: asyncio.run(run(app, f"/{path}", args.repeat)) for path in ("response_model", "json_response")}
+
+        slow, fast = results["response_model"][0], results["json_response"][0]
+        print(f"{count} rows ({results['json_response'][1] / 1024:.0f} KiB)")
+        for path, (elapsed, _) in results.items():
+            print(f"  {path:>14}: {elapsed * 1000:.1f}ms")
+        print(f"  {'speedup':>14}: {slow / fast:.1f}x")
+
+if __name__ == "__main__":
+    main()